@@ -15,9 +15,10 @@ default_args = {
 dag = DAG(
     "daily_realtime_etl",
     default_args=default_args,
-    description="Daily real-time ETL for US air quality data",
-    schedule_interval="59 23 * * *",
+    description="Hourly incremental real-time ETL for US air quality data",
+    schedule_interval="5 * * * *",
     catchup=False,
+    max_active_runs=1,  # Runs share the watermark files
 )
 
 extract = PythonOperator(
@@ -1,22 +1,28 @@
 import os
 import pandas as pd
-from dash import Dash, dcc, html, Input, Output
+from dash import Dash, dcc, html, Input, Output, State, ClientsideFunction, no_update, ctx
 from dotenv import load_dotenv
 import plotly.express as px
 
-from dashboard.db_helpers import (
-    get_location_markers, get_parameters_for_location,
-    get_parameter_records
+from dashboard.db_helpers import get_location_markers, get_parameters_for_location
+from dashboard.data_store import (
+    selection_key, load_selection, series_frame, available_years, hour_of_week_profile
 )
+from etl.parameter_bands import PARAMETER_BANDS
 from dashboard.plot_helpers import (
-    generate_line_plot, generate_calendar_heatmap,
-    generate_hourly_heatmap, generate_distribution_plot
+    line_plot_data, calendar_heatmap_data,
+    hourly_heatmap_data, distribution_data
 )
 from dashboard.summary_card import generate_summary_card
+from dashboard.map_helpers import (
+    viewport_from_relayout, cluster_markers, generate_map_figure, clicked_location,
+    MAP_ZOOM
+)
 
 # Load Mapbox token
 load_dotenv()
 px.set_mapbox_access_token(os.getenv("mapbox_token"))
+MAP_REFRESH_MS = 5 * 60 * 1000  # Picks up markers refreshed by the realtime ETL
 
 # Dash App
 app = Dash(__name__)
@@ -26,19 +32,8 @@ app.title = "United States Air Quality Dashboard"
 app.layout = html.Div([
     html.H2("🇺🇸 Air Quality Dashboard (US)"),
 
-    dcc.Graph(id="map", figure=px.scatter_mapbox(
-        get_location_markers(),
-        lat="lat",
-        lon="lon",
-        hover_name="location_name",
-        hover_data=["locality"],
-        zoom=3.5,
-        height=500,
-        color_discrete_sequence=["#008080"]
-    ).update_layout(
-        mapbox_style="light",
-        margin={"r": 0, "t": 0, "l": 0, "b": 0}
-    )),
+    dcc.Graph(id="map"),
+    dcc.Interval(id="map-refresh", interval=MAP_REFRESH_MS),
 
     html.Div([
         html.Label("Select Parameter"),
@@ -90,86 +85,187 @@ app.layout = html.Div([
         )
     ], style={"marginBottom": "20px"}),
 
-    dcc.Graph(id="timeseries-graph")
+    dcc.Graph(id="timeseries-graph"),
+
+    # Key of the selected location/parameter; its data stays in the server cache
+    dcc.Store(id="selection-data"),
+
+    # Aggregated series behind every view for the selection and year; the
+    # browser builds and switches the figures (assets/view_switch.js)
+    dcc.Store(id="view-data"),
+
+    # Full-resolution series for the zoomed x-range of the line plot, if any
+    dcc.Store(id="zoom-data")
 ])
 
 # Callbacks
 
+@app.callback(
+    Output("map", "figure"),
+    Input("map", "relayoutData"),
+    Input("map-refresh", "n_intervals")
+)
+def update_map(relayout, _):
+    # Markers come precomputed (and cached); only the clustering runs per view
+    viewport = viewport_from_relayout(relayout)
+    if relayout and viewport is None and ctx.triggered_id == "map":
+        return no_update
+    zoom, bounds = viewport or (MAP_ZOOM, None)
+    return generate_map_figure(cluster_markers(get_location_markers(), zoom, bounds))
+
 @app.callback(
     Output("parameter-radio", "options"),
     Input("map", "clickData")
 )
 def update_parameters(clickData):
-    if clickData:
-        location_name = clickData["points"][0]["hovertext"]
+    location_name = clicked_location(clickData)
+    if location_name:
         return get_parameters_for_location(location_name)
     return []
 
 @app.callback(
-    Output("summary-card", "children"),
+    Output("selection-data", "data"),
     Input("map", "clickData"),
     Input("parameter-radio", "value")
 )
-def update_summary(clickData, parameter):
-    if clickData and parameter:
-        location_name = clickData["points"][0]["hovertext"]
-        return generate_summary_card(location_name, parameter)
+def select_location(clickData, parameter):
+    # Loads the selection into the server cache; only its key goes to the browser
+    location_name = clicked_location(clickData)
+    if location_name and parameter:
+        key = selection_key(location_name, parameter)
+        load_selection(key)  # One query per selection, shared by the callbacks below
+        return key
+    return None
+
+@app.callback(
+    Output("summary-card", "children"),
+    Input("selection-data", "data")
+)
+def update_summary(key):
+    data = load_selection(key)
+    if data:
+        return generate_summary_card(
+            series_frame(data["raw"]), data["units"], data["location_name"], data["parameter"]
+        )
     return html.P("Click a location and choose a parameter to see stats.")
 
 @app.callback(
     Output("year-dropdown", "options"),
-    Input("map", "clickData"),
-    Input("parameter-radio", "value")
+    Input("selection-data", "data")
 )
-def update_year_dropdown(clickData, parameter):
-    if clickData and parameter:
-        location_name = clickData["points"][0]["hovertext"]
-        df, _ = get_parameter_records(location_name, parameter)
-        if not df.empty:
-            years = sorted(df["datetime"].dt.year.unique())
-            return [{"label": str(y), "value": y} for y in years]
+def update_year_dropdown(key):
+    data = load_selection(key)
+    if data:
+        return [{"label": str(y), "value": y} for y in available_years(data)]
     return []
 
-@app.callback(
+# Plot-type and aggregation switches run in the browser (assets/view_switch.js)
+app.clientside_callback(
+    ClientsideFunction(namespace="views", function_name="toggleAggVisibility"),
     Output("agg-toggle-container", "style"),
     Input("plot-type-radio", "value")
 )
-def toggle_agg_visibility(plot_type):
-    if plot_type == "line":
-        return {"marginBottom": "20px"}
-    return {"display": "none"}
 
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace="views", function_name="buildFigure"),
     Output("timeseries-graph", "figure"),
-    Input("map", "clickData"),
-    Input("parameter-radio", "value"),
-    Input("agg-toggle", "value"),
-    Input("year-dropdown", "value"),
-    Input("plot-type-radio", "value")
+    Input("view-data", "data"),
+    Input("zoom-data", "data"),
+    Input("plot-type-radio", "value"),
+    Input("agg-toggle", "value")
 )
-def update_plot(clickData, parameter, agg_level, selected_year, plot_type):
-    if clickData and parameter:
-        location_name = clickData["points"][0]["hovertext"]
-        df, _ = get_parameter_records(location_name, parameter)
 
-        if df.empty:
-            return px.scatter(title="No data available.")
+def filter_year(df, selected_year):
+    if selected_year:
+        df = df[df["datetime"].dt.year == selected_year]
+    return df.set_index("datetime")
 
-        if selected_year:
-            df = df[df["datetime"].dt.year == selected_year]
+@app.callback(
+    Output("view-data", "data"),
+    Input("selection-data", "data"),
+    Input("year-dropdown", "value")
+)
+def build_view_data(key, selected_year):
+    # Only aggregated, downsampled series are sent; no figure JSON
+    data = load_selection(key)
+    if not data:
+        return None
+    parameter = data["parameter"]
+    views = {
+        "selection": key,
+        "parameter": parameter,
+        "year": selected_year,
+        "bands": PARAMETER_BANDS.get(parameter, []),
+        "lines": {},
+    }
 
-        df.set_index("datetime", inplace=True)
+    # Daily/weekly/monthly lines use the means pre-aggregated at load time
+    raw = filter_year(series_frame(data["raw"]), selected_year)
+    for agg_level in ["H", "D", "W", "M"]:
+        df = raw if agg_level == "H" else filter_year(series_frame(data[agg_level]), selected_year)
+        if not df.empty:
+            views["lines"][agg_level] = line_plot_data(df, agg_level)
+
+    daily = filter_year(series_frame(data["D"]), selected_year)
+    if not daily.empty:
+        views["calendar"] = calendar_heatmap_data(daily)
+
+    profile = hour_of_week_profile(data, selected_year)
+    if not profile.empty:
+        views["hourly"] = hourly_heatmap_data(profile)
+
+    if not raw.empty:
+        views["distribution"] = distribution_data(raw)
+    return views
+
+def zoom_window(relayout):
+    """(start, end) of a zoomed x-axis, "reset" on autorange, else None."""
+    if not relayout:
+        return None
+    if relayout.get("xaxis.autorange"):
+        return "reset"
+    if "xaxis.range[0]" in relayout and "xaxis.range[1]" in relayout:
+        return relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]
+    if "xaxis.range" in relayout:
+        return tuple(relayout["xaxis.range"])
+    return None
+
+@app.callback(
+    Output("zoom-data", "data"),
+    Input("timeseries-graph", "relayoutData"),
+    State("selection-data", "data"),
+    State("agg-toggle", "value"),
+    State("year-dropdown", "value"),
+    State("plot-type-radio", "value"),
+    prevent_initial_call=True
+)
+def zoom_line_plot(relayout, key, agg_level, selected_year, plot_type):
+    # Only the x-range and the selection key come in; the zoomed window is cut
+    # from the server-side selection cache and gets the full point budget
+    window = zoom_window(relayout)
+    if not key or plot_type != "line" or window is None:
+        return no_update
+    if window == "reset":
+        return None
 
-        if plot_type == "line":
-            return generate_line_plot(df, parameter, agg_level)
-        elif plot_type == "calendar":
-            return generate_calendar_heatmap(df, parameter, selected_year)
-        elif plot_type == "hourly":
-            return generate_hourly_heatmap(df, parameter)
-        elif plot_type == "distribution":
-            return generate_distribution_plot(df, parameter)
+    data = load_selection(key)
+    if not data:
+        return no_update
+    series = data["raw"] if agg_level == "H" else data[agg_level]
+    df = filter_year(series_frame(series), selected_year)
+    start, end = pd.Timestamp(window[0]), pd.Timestamp(window[1])
+    df = df[(df.index >= start) & (df.index <= end)]
+    if df.empty:
+        return no_update
 
-    return px.scatter(title="Click a location and select a parameter.")
+    # The browser only applies a zoom that matches the view it is showing
+    return {
+        "selection": key,
+        "year": selected_year,
+        "agg": agg_level,
+        "range": list(window),
+        "line": line_plot_data(df, agg_level),
+    }
 
 if __name__ == "__main__":
     app.run(debug=True)
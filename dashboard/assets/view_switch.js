@@ -0,0 +1,123 @@
+// Clientside callbacks for the view switches. The server sends only the
+// aggregated series behind each view (the "view-data" store, built once per
+// selection and year); the selected figure is built here, so switching the
+// plot type or aggregation level needs no server round trip.
+(function () {
+    function titled(text, extra) {
+        return Object.assign({title: {text: text}}, extra || {});
+    }
+
+    function placeholder(text) {
+        return {data: [], layout: titled(text)};
+    }
+
+    function bandShapes(bands) {
+        var shapes = [];
+        var annotations = [];
+        bands.forEach(function (band) {
+            shapes.push({
+                type: "rect", xref: "paper", x0: 0, x1: 1, yref: "y",
+                y0: band[0], y1: band[1], fillcolor: band[2], opacity: 0.2,
+                line: {width: 0}, layer: "below"
+            });
+            annotations.push({
+                xref: "paper", x: 0, xanchor: "left", yref: "y", y: band[1],
+                yanchor: "top", text: band[3], showarrow: false
+            });
+        });
+        return {shapes: shapes, annotations: annotations};
+    }
+
+    function lineFigure(views, series) {
+        // Epoch milliseconds on a date axis; large traces render with WebGL
+        return {
+            data: [{
+                type: series.webgl ? "scattergl" : "scatter",
+                mode: series.webgl ? "lines" : "lines+markers",
+                x: series.t,
+                y: series.v,
+                line: {color: "#007ACC", width: 2},
+                connectgaps: true
+            }],
+            layout: titled(views.parameter.toUpperCase() + " Trend", Object.assign({
+                xaxis: {type: "date", title: {text: "datetime"}},
+                yaxis: {title: {text: "value"}}
+            }, bandShapes(views.bands)))
+        };
+    }
+
+    function heatmapFigure(cells, colorscale, title, xTitle, yTitle) {
+        return {
+            data: [{type: "heatmap", x: cells.x, y: cells.y, z: cells.z,
+                    colorscale: colorscale}],
+            layout: titled(title, {
+                xaxis: {title: {text: xTitle}},
+                yaxis: {title: {text: yTitle}}
+            })
+        };
+    }
+
+    function distributionFigure(views, bins) {
+        return {
+            data: [{type: "bar", x: bins.x, y: bins.y, width: bins.width}],
+            layout: titled(views.parameter.toUpperCase() + " Distribution", {
+                bargap: 0,
+                xaxis: {title: {text: "value"}},
+                yaxis: {title: {text: "count"}}
+            })
+        };
+    }
+
+    function matchesView(zoom, views, aggLevel) {
+        // A zoom is only kept while the selection, year and level are unchanged
+        return zoom && zoom.agg === aggLevel && zoom.year === views.year &&
+            JSON.stringify(zoom.selection) === JSON.stringify(views.selection);
+    }
+
+    function viewFigure(views, zoom, plotType, aggLevel) {
+        var name = views.parameter.toUpperCase();
+        if (plotType === "line" && matchesView(zoom, views, aggLevel)) {
+            var figure = lineFigure(views, zoom.line);
+            figure.layout.xaxis.range = zoom.range;
+            return figure;
+        }
+        if (plotType === "line" && views.lines[aggLevel]) {
+            return lineFigure(views, views.lines[aggLevel]);
+        }
+        if (plotType === "calendar" && views.calendar) {
+            return heatmapFigure(
+                views.calendar, "YlOrRd",
+                name + " Calendar Heatmap (" + (views.year || "All") + ")",
+                "day", "month"
+            );
+        }
+        if (plotType === "hourly" && views.hourly) {
+            return heatmapFigure(
+                views.hourly, "Blues", name + " by Hour & Day of Week",
+                "hour", "dayofweek"
+            );
+        }
+        if (plotType === "distribution" && views.distribution) {
+            return distributionFigure(views, views.distribution);
+        }
+        return placeholder("No data available.");
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        views: {
+            buildFigure: function (views, zoom, plotType, aggLevel) {
+                if (!views) {
+                    return placeholder("Click a location and select a parameter.");
+                }
+                return viewFigure(views, zoom, plotType, aggLevel);
+            },
+
+            toggleAggVisibility: function (plotType) {
+                if (plotType === "line") {
+                    return {"marginBottom": "20px"};
+                }
+                return {"display": "none"};
+            }
+        }
+    });
+})();
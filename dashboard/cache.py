@@ -0,0 +1,179 @@
+import os
+import time
+import pickle
+import hashlib
+import threading
+import functools
+from collections import OrderedDict
+import pandas as pd
+from dotenv import load_dotenv
+
+# Query cache shared by all dashboard callbacks. Entries expire after a TTL and
+# are also dropped as soon as the ETL reports a newer load (see `memoize`).
+load_dotenv()
+CACHE_BACKEND = os.getenv("DASH_CACHE_BACKEND", "memory")  # "memory" or "filesystem"
+CACHE_DIR = os.getenv("DASH_CACHE_DIR", "data/dashboard_cache")
+CACHE_TTL_SECONDS = int(os.getenv("DASH_CACHE_TTL_SECONDS", "900"))
+CACHE_MAX_ENTRIES = int(os.getenv("DASH_CACHE_MAX_ENTRIES", "256"))
+VERSION_CHECK_SECONDS = 30  # How often to ask MongoDB whether new data landed
+
+
+class MemoryCache:
+    """Per-process LRU cache with a TTL per entry."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """(True, value) on a live hit, (False, None) otherwise."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FileSystemCache:
+    """Pickle-file cache shared by every worker process on one host.
+
+    Each entry is one file; reads refresh its mtime, so evicting the oldest
+    mtimes approximates LRU across processes.
+    """
+
+    def __init__(
+        self, directory=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.pkl")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        if expires_at < time.time():
+            self._remove(path)
+            return False, None
+        os.utime(path)
+        return True, value
+
+    def set(self, key, value):
+        # Write-then-rename so concurrent readers never see a partial file
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((time.time() + self.ttl, value), f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            self._remove(os.path.join(self.directory, name))
+
+    def _evict(self):
+        paths = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(".pkl")
+        ]
+        if len(paths) <= self.max_entries:
+            return
+        paths.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in paths[: len(paths) - self.max_entries]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def make_cache(backend=CACHE_BACKEND):
+    if backend == "filesystem":
+        return FileSystemCache()
+    return MemoryCache()
+
+
+_cache = make_cache()
+
+
+def _copy(value):
+    # Callers mutate their DataFrames (sort/set_index in place), so never hand
+    # out the cached object itself
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy(v) for v in value)
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def memoize(version=None, cache=None):
+    """Cache a query function's results by its arguments.
+
+    `version` returns a marker (e.g. the time of the last ETL load) that is
+    checked at most every VERSION_CHECK_SECONDS and made part of every key, so
+    a new load invalidates older entries without waiting for their TTL.
+    """
+    state = {"checked_at": float("-inf"), "version": None}
+    state_lock = threading.Lock()
+
+    def current_version():
+        if version is None:
+            return None
+        with state_lock:
+            now = time.monotonic()
+            if now - state["checked_at"] >= VERSION_CHECK_SECONDS:
+                state["version"] = version()
+                state["checked_at"] = now
+            return state["version"]
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            store = cache or _cache
+            key = (
+                func.__module__,
+                func.__qualname__,
+                args,
+                tuple(sorted(kwargs.items())),
+                current_version(),
+            )
+            hit, value = store.get(key)
+            if not hit:
+                value = func(*args, **kwargs)
+                store.set(key, value)
+            return _copy(value)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,101 @@
+import pandas as pd
+from dashboard.db_helpers import (
+    cached,
+    get_parameter_records,
+    get_rollup_records,
+    get_hour_of_week_cells,
+)
+from dashboard.plot_helpers import RESAMPLE_RULES
+
+# Everything the dashboard shows for one location/parameter, loaded once per
+# selection into the server-side query cache; the browser only holds the
+# selection key, and every view is derived from the cached data without new
+# queries
+AGG_LEVELS = ["D", "W", "M"]
+PROFILE_COLUMNS = ["year", "dayofweek", "hour", "sum", "count"]
+
+
+def _series(df):
+    # Epoch milliseconds keep the JSON payload small and parse back exactly
+    millis = (df["datetime"] - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)
+    return {"t": millis.tolist(), "v": df["value"].tolist()}
+
+
+def series_frame(series):
+    """DataFrame (datetime, value) from a stored series."""
+    return pd.DataFrame(
+        {
+            "datetime": pd.to_datetime(
+                pd.Series(series["t"], dtype="int64"), unit="ms"
+            ),
+            "value": pd.Series(series["v"], dtype="float64"),
+        }
+    )
+
+
+def selection_key(location_name, parameter):
+    """What the browser stores for a selection, in place of its data."""
+    return {"location_name": location_name, "parameter": parameter}
+
+
+def load_selection(key):
+    """Cached selection data for a key from `selection_key`, or None."""
+    if not key:
+        return None
+    return build_selection_data(key["location_name"], key["parameter"])
+
+
+@cached
+def build_selection_data(location_name, parameter):
+    """Raw series, D/W/M means and hour-of-week cells for one selection.
+
+    Aggregates come from the ETL rollups; when those have not been built yet
+    they are derived from the raw series instead. The result is shared
+    through the query cache, so callers must not modify it.
+    """
+    raw, units = get_parameter_records(location_name, parameter)
+    indexed = raw.set_index("datetime")
+
+    data = {
+        "location_name": location_name,
+        "parameter": parameter,
+        "units": units,
+        "raw": _series(raw),
+    }
+    for agg_level in AGG_LEVELS:
+        df = get_rollup_records(location_name, parameter, agg_level)
+        if df.empty and not raw.empty:
+            rule = RESAMPLE_RULES[agg_level]
+            df = indexed[["value"]].resample(rule).mean().dropna().reset_index()
+        data[agg_level] = _series(df)
+
+    cells = get_hour_of_week_cells(location_name, parameter)
+    if cells.empty and not raw.empty:
+        cells = raw.assign(
+            year=raw["datetime"].dt.year,
+            dayofweek=raw["datetime"].dt.day_name(),
+            hour=raw["datetime"].dt.hour,
+        )
+        cells = cells.groupby(["year", "dayofweek", "hour"], as_index=False)[
+            "value"
+        ].agg(sum="sum", count="count")
+    data["profile"] = {col: cells[col].tolist() for col in PROFILE_COLUMNS}
+    return data
+
+
+def available_years(data):
+    years = set(series_frame(data["raw"])["datetime"].dt.year)
+    years |= set(series_frame(data["D"])["datetime"].dt.year)
+    return sorted(int(y) for y in years)
+
+
+def hour_of_week_profile(data, year=None):
+    """Mean per (dayofweek, hour), over all years or just `year`."""
+    cells = pd.DataFrame(data["profile"], columns=PROFILE_COLUMNS)
+    if year:
+        cells = cells[cells["year"] == year]
+    profile = cells.groupby(["dayofweek", "hour"], as_index=False)[
+        ["sum", "count"]
+    ].sum()
+    profile["value"] = profile["sum"] / profile["count"]
+    return profile[["dayofweek", "hour", "value"]]
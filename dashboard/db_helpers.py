@@ -1,53 +1,291 @@
 from pymongo import MongoClient
 import pandas as pd
+import numpy as np
+import calendar
 import os
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from dashboard.cache import memoize
+from etl.nested_store import NESTED_COLLECTION
+from etl.bucket_store import LOCATIONS_COLLECTION, BUCKETS_COLLECTION
+from etl.timeseries_store import TIMESERIES_COLLECTION
+from etl.rollup_store import DAILY_COLLECTION, PERIOD_COLLECTION, PROFILE_COLLECTION
+from etl.marker_store import MARKERS_COLLECTION
+from etl.etl_state import ETL_STATE_COLLECTION, LAST_LOAD_ID
 
-# Load environment variables
+# Load environment variables; collection names come from the ETL modules that
+# write them
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 DB_NAME = "air_quality"
-COLLECTION_NAME = "us_air_data"
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "nested")  # nested|bucketed|timeseries
 
 client = MongoClient(MONGO_URI)
-collection = client[DB_NAME][COLLECTION_NAME]
+db = client[DB_NAME]
+collection = db[NESTED_COLLECTION]
+buckets = db[BUCKETS_COLLECTION]
+measurements_ts = db[TIMESERIES_COLLECTION]
+daily_rollups = db[DAILY_COLLECTION]
+period_rollups = db[PERIOD_COLLECTION]
+profile_rollups = db[PROFILE_COLLECTION]
+markers = db[MARKERS_COLLECTION]
 
+# Location metadata lives in the nested documents themselves, or in the small
+# locations collection (same shape, no measurements) for the other layouts
+locations = collection if STORAGE_LAYOUT == "nested" else db[LOCATIONS_COLLECTION]
 
+
+def data_version():
+    """Time of the last ETL load, used to invalidate cached query results."""
+    state = db[ETL_STATE_COLLECTION].find_one({"_id": LAST_LOAD_ID})
+    return state["loaded_at"] if state else None
+
+
+# Query results are shared by all callbacks and dropped after each ETL load
+cached = memoize(version=data_version)
+
+
+@cached
 def get_location_options():
-    locations = collection.find({}, {"location_id": 1, "location_name": 1, "_id": 0})
+    cursor = locations.find({}, {"location_id": 1, "location_name": 1, "_id": 0})
     return [
-        {"label": loc["location_name"], "value": loc["location_id"]}
-        for loc in locations
+        {"label": loc["location_name"], "value": loc["location_id"]} for loc in cursor
     ]
 
 
-def get_parameters_for_location(location_id):
-    doc = collection.find_one({"location_id": location_id})
-    params = set(sensor["parameter"] for sensor in doc.get("sensors", []))
+@cached
+def get_parameters_for_location(location_name):
+    doc = locations.find_one({"location_name": location_name}, {"sensors.parameter": 1})
+    params = set(sensor["parameter"] for sensor in (doc or {}).get("sensors", []))
     return [{"label": p.upper(), "value": p} for p in sorted(params)]
 
 
+MARKER_COLUMNS = [
+    "location_id",
+    "location_name",
+    "locality",
+    "lat",
+    "lon",
+    "parameter",
+    "value",
+    "category",
+]
+
+
+@cached
 def get_location_markers():
-    cursor = collection.find(
-        {},
+    """One row per location with its latest headline reading and category.
+
+    Reads the precomputed marker collection; until it has been built, falls
+    back to bare coordinates from the location documents.
+    """
+    projection = {"_id": 0, **{column: 1 for column in MARKER_COLUMNS}}
+    data = list(markers.find({}, projection))
+    if not data:
+        cursor = locations.find(
+            {},
+            {
+                "_id": 0,
+                "location_id": 1,
+                "location_name": 1,
+                "locality": 1,
+                "coordinates": 1,
+            },
+        )
+        for doc in cursor:
+            if doc.get("coordinates"):
+                data.append(
+                    {
+                        "location_id": doc["location_id"],
+                        "location_name": doc["location_name"],
+                        "locality": doc.get("locality"),
+                        "lat": doc["coordinates"]["latitude"],
+                        "lon": doc["coordinates"]["longitude"],
+                    }
+                )
+    df = pd.DataFrame(data, columns=MARKER_COLUMNS)
+    df["category"] = df["category"].fillna("Unknown")
+    return df
+
+
+@cached
+def _location_id(location_name):
+    # Cached, so the several rollup and record reads of one selection share a
+    # single lookup
+    loc = locations.find_one({"location_name": location_name}, {"location_id": 1})
+    return loc["location_id"] if loc else None
+
+
+def _epoch_ms(date_field, hour_field):
+    # "YYYY-MM-DD" date plus hour, as UTC epoch milliseconds
+    return {
+        "$add": [
+            {"$toLong": {"$dateFromString": {"dateString": date_field}}},
+            {"$multiply": [hour_field, 3600000]},
+        ]
+    }
+
+
+# Packs the projected {t, v, units} rows into one array document per month, so
+# the client receives a handful of documents instead of one per measurement
+ARRAYS_BY_MONTH = {
+    "$group": {
+        "_id": {"$dateToString": {"date": {"$toDate": "$t"}, "format": "%Y-%m"}},
+        "t": {"$push": "$t"},
+        "v": {"$push": "$v"},
+        "units": {"$first": "$units"},
+    }
+}
+
+
+def _records_collection():
+    if STORAGE_LAYOUT == "timeseries":
+        return measurements_ts
+    if STORAGE_LAYOUT == "bucketed":
+        return buckets
+    return collection
+
+
+def parameter_records_pipeline(location, parameter, start=None, end=None):
+    """Aggregation returning monthly {t, v, units} arrays for one parameter.
+
+    `location` is the location name for the nested layout and the location ID
+    otherwise; `start` and `end` are inclusive "YYYY-MM-DD" dates.
+    """
+    date_range = {}
+    if start:
+        date_range["$gte"] = start
+    if end:
+        date_range["$lte"] = end
+
+    if STORAGE_LAYOUT == "timeseries":
+        match = {"meta.location_id": location, "meta.parameter": parameter}
+        time_range = {}
+        if start:
+            time_range["$gte"] = datetime.fromisoformat(start)
+        if end:
+            time_range["$lt"] = datetime.fromisoformat(end) + timedelta(days=1)
+        if time_range:
+            match["datetime"] = time_range
+        return [
+            {"$match": match},
+            {
+                "$project": {
+                    "_id": 0,
+                    "t": {"$toLong": "$datetime"},
+                    "v": "$value",
+                    "units": "$meta.units",
+                }
+            },
+            ARRAYS_BY_MONTH,
+        ]
+
+    if STORAGE_LAYOUT == "bucketed":
+        match = {"location_id": location, "parameter": parameter}
+        if date_range:
+            match["date"] = date_range
+        return [
+            {"$match": match},
+            {"$unwind": "$measurements"},
+            {
+                "$project": {
+                    "_id": 0,
+                    "t": _epoch_ms("$date", "$measurements.hour"),
+                    "v": "$measurements.value",
+                    "units": 1,
+                }
+            },
+            ARRAYS_BY_MONTH,
+        ]
+
+    pipeline = [
+        {"$match": {"location_name": location}},
+        {"$unwind": "$sensors"},
+        {"$match": {"sensors.parameter": parameter}},
+        {"$unwind": "$sensors.measurements"},
+    ]
+    if date_range:
+        pipeline.append({"$match": {"sensors.measurements.date": date_range}})
+    pipeline += [
         {
-            "_id": 0,
-            "location_id": 1,
-            "location_name": 1,
-            "locality": 1,
-            "coordinates": 1,
+            "$project": {
+                "_id": 0,
+                "t": _epoch_ms(
+                    "$sensors.measurements.date", "$sensors.measurements.hour"
+                ),
+                "v": "$sensors.measurements.value",
+                "units": "$sensors.units",
+            }
         },
+        ARRAYS_BY_MONTH,
+    ]
+    return pipeline
+
+
+@cached
+def get_parameter_records(location_name, parameter, start=None, end=None):
+    """Hourly (datetime, value) records for one location/parameter, plus units.
+
+    Filtering, unwinding and packing happen in MongoDB; the monthly arrays
+    go straight into the DataFrame. `start`/`end` are inclusive ISO dates.
+    """
+    location = location_name
+    if STORAGE_LAYOUT != "nested":
+        location = _location_id(location_name)
+
+    chunks = list(
+        _records_collection().aggregate(
+            parameter_records_pipeline(location, parameter, start, end)
+        )
     )
-    data = []
-    for doc in cursor:
-        if doc.get("coordinates"):
-            data.append(
-                {
-                    "location_id": doc["location_id"],
-                    "location_name": doc["location_name"],
-                    "locality": doc.get("locality"),
-                    "lat": doc["coordinates"]["latitude"],
-                    "lon": doc["coordinates"]["longitude"],
-                }
-            )
-    return pd.DataFrame
+    units = next((c["units"] for c in chunks if c.get("units")), "unknown")
+    times = np.concatenate([c["t"] for c in chunks]) if chunks else []
+    values = np.concatenate([c["v"] for c in chunks]) if chunks else []
+
+    df = pd.DataFrame(
+        {
+            "datetime": pd.to_datetime(np.asarray(times, dtype="int64"), unit="ms"),
+            "value": np.asarray(values, dtype="float64"),
+        }
+    )
+    df = df.sort_values("datetime", kind="stable").reset_index(drop=True)
+    return df, units
+
+
+# Rollups (maintained by the ETL, see etl/rollup_store.py)
+
+
+@cached
+def get_rollup_records(location_name, parameter, agg_level):
+    """Daily ("D"), weekly ("W") or monthly ("M") means from the rollups.
+
+    Dates match pandas resample labels, and sensors measuring the same
+    parameter are combined through their sums and counts.
+    """
+    query = {"location_id": _location_id(location_name), "parameter": parameter}
+    fields = {"_id": 0, "date": 1, "sum": 1, "count": 1}
+    if agg_level == "D":
+        cursor = daily_rollups.find(query, fields)
+    else:
+        cursor = period_rollups.find({**query, "period": agg_level}, fields)
+
+    df = pd.DataFrame(list(cursor), columns=["date", "sum", "count"])
+    df = df.groupby("date", as_index=False)[["sum", "count"]].sum()
+    df["datetime"] = pd.to_datetime(df["date"])
+    df["value"] = df["sum"] / df["count"]
+    return df[["datetime", "value"]].sort_values("datetime").reset_index(drop=True)
+
+
+@cached
+def get_hour_of_week_cells(location_name, parameter):
+    """Per-year (dayofweek, hour) sums and counts from the hour-of-week rollups."""
+    query = {"location_id": _location_id(location_name), "parameter": parameter}
+    cells = [
+        {**cell, "year": int(doc["month"][:4])}
+        for doc in profile_rollups.find(query, {"_id": 0, "month": 1, "cells": 1})
+        for cell in doc["cells"]
+    ]
+    df = pd.DataFrame(cells, columns=["year", "dow", "hour", "sum", "count"])
+    df["dayofweek"] = df["dow"].map(lambda d: calendar.day_name[d - 1])
+    keys = ["year", "dayofweek", "hour"]
+    return df.groupby(keys, as_index=False)[["sum", "count"]].sum()
@@ -0,0 +1,130 @@
+import numpy as np
+import plotly.express as px
+
+# Marker clustering for the location map: markers in the current viewport are
+# grouped on a lat/lon grid whose cells shrink as the map zooms in, so the
+# browser draws at most a few hundred points at any zoom level
+MAP_CENTER = {"lat": 39.5, "lon": -98.35}
+MAP_ZOOM = 3.5
+CLUSTER_CELL_DEGREES = 60  # Grid cell size at zoom 0, halved per zoom level
+CLUSTER_MAX_ZOOM = 9  # From this zoom on every location is its own marker
+
+# Worst category first; a cluster takes the worst category among its locations
+CATEGORY_COLORS = {
+    "Hazardous": "#7e0023",
+    "Unhealthy": "#d62728",
+    "USG": "#ff7f0e",
+    "Moderate": "#e6c300",
+    "Good": "#2ca02c",
+    "Unknown": "#008080",
+}
+CATEGORY_RANK = {category: rank for rank, category in enumerate(CATEGORY_COLORS)}
+
+
+def viewport_from_relayout(relayout):
+    """(zoom, bounds) from a mapbox relayoutData event, None if it has neither.
+
+    `bounds` is (west, south, east, north) taken from the corner coordinates
+    plotly reports under "mapbox._derived".
+    """
+    if not relayout or not any(key.startswith("mapbox") for key in relayout):
+        return None
+    zoom = relayout.get("mapbox.zoom", MAP_ZOOM)
+    bounds = None
+    corners = relayout.get("mapbox._derived", {}).get("coordinates")
+    if corners:
+        lons, lats = zip(*corners)
+        bounds = (min(lons), min(lats), max(lons), max(lats))
+    return zoom, bounds
+
+
+def cluster_cell_size(zoom):
+    """Grid cell size in degrees, or None when markers are not clustered."""
+    if zoom >= CLUSTER_MAX_ZOOM:
+        return None
+    return CLUSTER_CELL_DEGREES / 2**zoom
+
+
+def cluster_markers(markers, zoom=MAP_ZOOM, bounds=None):
+    """Markers in `bounds` grouped into grid cells for `zoom`.
+
+    Returns the marker columns plus `count`; a multi-location cluster sits at
+    its locations' mean position, is named after its size and carries the
+    worst category among them. The grid is anchored at 0/0, so panning never
+    moves a cluster.
+    """
+    cell = cluster_cell_size(zoom)
+    if bounds is not None:
+        # Pad by a cell so clusters on the edge keep all of their locations
+        pad = cell or 0
+        west, south, east, north = bounds
+        markers = markers[
+            markers["lon"].between(west - pad, east + pad)
+            & markers["lat"].between(south - pad, north + pad)
+        ]
+
+    markers = markers.assign(count=1)
+    if cell is None or markers.empty:
+        return markers
+
+    markers = markers.assign(
+        rank=markers["category"].map(CATEGORY_RANK).fillna(len(CATEGORY_RANK)),
+        cell_x=np.floor(markers["lon"] / cell),
+        cell_y=np.floor(markers["lat"] / cell),
+    )
+    worst = markers.sort_values("rank").groupby(["cell_x", "cell_y"]).head(1)
+    worst = worst.set_index(["cell_x", "cell_y"])
+    grouped = markers.groupby(["cell_x", "cell_y"]).agg(
+        lat=("lat", "mean"), lon=("lon", "mean"), count=("count", "sum")
+    )
+
+    clusters = worst.drop(columns=["lat", "lon", "count", "rank"]).join(grouped)
+    multiple = clusters["count"] > 1
+    clusters.loc[multiple, "location_name"] = (
+        clusters.loc[multiple, "count"].astype(str) + " stations"
+    )
+    clusters.loc[multiple, ["location_id", "locality", "value"]] = None
+    return clusters.reset_index(drop=True)
+
+
+def marker_size(count):
+    return 10 + 6 * np.log2(count)
+
+
+def generate_map_figure(clusters):
+    fig = px.scatter_mapbox(
+        clusters,
+        lat="lat",
+        lon="lon",
+        color="category",
+        color_discrete_map=CATEGORY_COLORS,
+        category_orders={"category": list(CATEGORY_COLORS)},
+        hover_name="location_name",
+        hover_data={"locality": True, "parameter": True, "value": True},
+        custom_data=["count"],
+        center=MAP_CENTER,
+        zoom=MAP_ZOOM,
+        height=500,
+    )
+    fig.for_each_trace(
+        lambda trace: trace.update(
+            marker_size=[marker_size(c) for c in trace.customdata[:, 0]]
+        )
+    )
+    # uirevision keeps the user's pan/zoom when the markers are refreshed
+    return fig.update_layout(
+        mapbox_style="light",
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        uirevision="map",
+        legend_title_text="Latest AQI category",
+    )
+
+
+def clicked_location(clickData):
+    """Location name of a clicked marker, None for clusters and empty clicks."""
+    if not clickData:
+        return None
+    point = clickData["points"][0]
+    if point.get("customdata", [1])[0] > 1:
+        return None
+    return point["hovertext"]
@@ -1,65 +1,108 @@
+import numpy as np
 import pandas as pd
-import plotly.express as px
-from dashboard.constants import PARAMETER_BANDS
 
+# Offsets for the agg-toggle values; the "H" and "M" aliases were renamed in
+# newer pandas releases, offset objects work across versions
+RESAMPLE_RULES = {
+    "H": pd.offsets.Hour(),
+    "D": pd.offsets.Day(),
+    "W": pd.offsets.Week(weekday=6),
+    "M": pd.offsets.MonthEnd(),
+}
 
-def generate_line_plot(df, parameter, agg_level):
-    df_resampled = df.resample(agg_level).mean().reset_index()
-    fig = px.line(
-        df_resampled, x="datetime", y="value", title=f"{parameter.upper()} Trend"
-    )
-    fig.update_traces(
-        line=dict(color="#007ACC", width=2), connectgaps=True, mode="lines+markers"
-    )
 
-    bands = PARAMETER_BANDS.get(parameter)
-    if bands:
-        for y0, y1, color, label in bands:
-            fig.add_hrect(
-                y0=y0,
-                y1=y1,
-                fillcolor=color,
-                line_width=0,
-                opacity=0.2,
-                annotation_text=label,
-                annotation_position="top left",
-            )
-    return fig
-
-
-def generate_calendar_heatmap(df, parameter, year=None):
-    df_daily = df[["value"]].resample("D").mean().reset_index()
-    df_daily["day"] = df_daily["datetime"].dt.day
-    df_daily["month"] = df_daily["datetime"].dt.month
-    df_daily["year"] = df_daily["datetime"].dt.year
-
-    title = f"{parameter.upper()} Calendar Heatmap ({year or 'All'})"
-    return px.density_heatmap(
-        df_daily,
-        x="day",
-        y="month",
-        z="value",
-        color_continuous_scale="YlOrRd",
-        title=title,
-    )
+# Level of detail for line plots: at most this many points per trace reach the
+# browser, and longer traces render with WebGL and without markers
+MAX_POINTS_PER_TRACE = 2000
+WEBGL_THRESHOLD = 1000
 
 
-def generate_hourly_heatmap(df, parameter):
-    df["hour"] = df.index.hour
-    df["dayofweek"] = df.index.day_name()
-    df_hourly = df.groupby(["dayofweek", "hour"]).mean().reset_index()
+def lttb_indices(x, y, threshold):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points plus, for every bucket in between, the
+    point forming the largest triangle with the previously kept point and the
+    next bucket's average, which preserves peaks that plain decimation drops.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def downsample(df, max_points=MAX_POINTS_PER_TRACE):
+    """Reduce a (datetime, value) frame to at most `max_points` rows with LTTB."""
+    if len(df) <= max_points:
+        return df
+    x = df["datetime"].astype("int64").to_numpy(dtype="float64")
+    y = df["value"].to_numpy(dtype="float64")
+    return df.iloc[lttb_indices(x, y, max_points)]
 
-    return px.density_heatmap(
-        df_hourly,
-        x="hour",
-        y="dayofweek",
-        z="value",
-        color_continuous_scale="Blues",
-        title=f"{parameter.upper()} by Hour & Day of Week",
-    )
 
+# View data: the aggregated series each plot needs, in a compact JSON shape.
+# Figures are built from it in the browser (assets/view_switch.js).
 
-def generate_distribution_plot(df, parameter):
-    return px.histogram(
-        df.reset_index(), x="value", nbins=50, title=f"{parameter.upper()} Distribution"
+
+def _epoch_ms(datetimes):
+    return ((datetimes - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)).tolist()
+
+
+def line_plot_data(df, agg_level, max_points=MAX_POINTS_PER_TRACE):
+    """Resampled, LTTB-downsampled {t, v, webgl} points for a line plot."""
+    df_resampled = df.resample(RESAMPLE_RULES[agg_level]).mean().dropna()
+    points = downsample(df_resampled.reset_index(), max_points)
+    return {
+        "t": _epoch_ms(points["datetime"]),
+        "v": points["value"].tolist(),
+        "webgl": len(points) > WEBGL_THRESHOLD,
+    }
+
+
+def calendar_heatmap_data(df):
+    """Mean daily value per (month, day of month) cell."""
+    daily = df[["value"]].resample(RESAMPLE_RULES["D"]).mean().dropna().reset_index()
+    cells = (
+        daily.assign(month=daily["datetime"].dt.month, day=daily["datetime"].dt.day)
+        .groupby(["month", "day"], as_index=False)["value"]
+        .mean()
     )
+    return {
+        "x": cells["day"].tolist(),
+        "y": cells["month"].tolist(),
+        "z": cells["value"].tolist(),
+    }
+
+
+def hourly_heatmap_data(profile):
+    # `profile` holds one pre-aggregated mean per (dayofweek, hour)
+    return {
+        "x": profile["hour"].tolist(),
+        "y": profile["dayofweek"].tolist(),
+        "z": profile["value"].tolist(),
+    }
+
+
+def distribution_data(df, nbins=50):
+    """Histogram bin centers, counts and bin width for a value distribution."""
+    counts, edges = np.histogram(df["value"].to_numpy(dtype="float64"), bins=nbins)
+    return {
+        "x": ((edges[:-1] + edges[1:]) / 2).tolist(),
+        "y": counts.tolist(),
+        "width": float(edges[1] - edges[0]),
+    }
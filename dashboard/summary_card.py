@@ -1,22 +1,8 @@
-import pandas as pd
 from dash import html
-from dashboard.constants import get_safety_label
-from dashboard.db_helpers import collection
+from etl.parameter_bands import get_safety_label
 
 
-def generate_summary_card(location_name, parameter):
-    doc = collection.find_one({"location_name": location_name})
-    records = []
-
-    units = "unknown"
-    for sensor in doc.get("sensors", []):
-        if sensor["parameter"] == parameter:
-            units = sensor.get("units", "unknown")
-            for m in sensor.get("measurements", []):
-                dt = pd.to_datetime(m["date"]) + pd.to_timedelta(m["hour"], unit="h")
-                records.append({"datetime": dt, "value": m["value"]})
-
-    df = pd.DataFrame(records)
+def generate_summary_card(df, units, location_name, parameter):
     if df.empty:
         return html.P("No data available.")
 
@@ -0,0 +1,161 @@
+import os
+import sys
+from collections import defaultdict
+from pymongo import MongoClient, UpdateOne, UpdateMany
+from dotenv import load_dotenv
+
+# Bucketed storage layout: one small metadata document per location plus one
+# document per sensor, parameter and UTC day holding that day's measurements
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DB_NAME = "air_quality"
+NESTED_COLLECTION = "us_air_data"
+LOCATIONS_COLLECTION = "locations"
+BUCKETS_COLLECTION = "measurement_buckets"
+BULK_BATCH_SIZE = int(os.getenv("MONGO_BULK_BATCH_SIZE", "1000"))
+
+# Recomputes a bucket's summary fields from its measurements array
+BUCKET_STATS_PIPELINE = [
+    {
+        "$set": {
+            "count": {"$size": "$measurements"},
+            "sum": {"$sum": "$measurements.value"},
+            "min": {"$min": "$measurements.value"},
+            "max": {"$max": "$measurements.value"},
+            "mean": {"$avg": "$measurements.value"},
+        }
+    }
+]
+
+
+def location_metadata(loc):
+    """Location document for the locations collection (no measurements)."""
+    return {
+        "location_id": loc["location_id"],
+        "location_name": loc["location_name"],
+        "country": loc["country"],
+        "locality": loc.get("locality"),
+        "coordinates": loc.get("coordinates"),
+        "sensors": [
+            {
+                "sensor_id": s["sensor_id"],
+                "parameter": s["parameter"],
+                "units": s.get("units", "unknown"),
+            }
+            for s in loc.get("sensors", [])
+        ],
+    }
+
+
+def location_upsert(loc):
+    """Upsert a location's metadata document, merging in any new sensors."""
+    meta = location_metadata(loc)
+    sensors = meta.pop("sensors")
+    return UpdateOne(
+        {"location_id": loc["location_id"]},
+        {"$set": meta, "$addToSet": {"sensors": {"$each": sensors}}},
+        upsert=True,
+    )
+
+
+def build_bucket_operations(structured):
+    """Phased (collection, operations) pairs for nested-shaped location documents.
+
+    Accepts the same documents the nested layout stores (sensors[].measurements[]
+    with date/hour/value). Phases must run in order: each hour in the batch is
+    pulled from its bucket before its new reading is pushed, so a revised
+    value replaces the stored one, and the stats phase reads the result.
+    """
+    location_ops, pull_ops, push_ops, stats_ops = [], [], [], []
+    for loc in structured:
+        if not loc.get("sensors"):
+            continue
+        location_ops.append(location_upsert(loc))
+
+        for sensor in loc.get("sensors", []):
+            by_date = defaultdict(list)
+            for m in sensor.get("measurements", []):
+                by_date[m["date"]].append({"hour": m["hour"], "value": m["value"]})
+            if not by_date:
+                continue
+
+            key = {"sensor_id": sensor["sensor_id"], "parameter": sensor["parameter"]}
+            for date, measurements in by_date.items():
+                hours = [m["hour"] for m in measurements]
+                pull_ops.append(
+                    UpdateOne(
+                        {**key, "date": date},
+                        {"$pull": {"measurements": {"hour": {"$in": hours}}}},
+                    )
+                )
+                push_ops.append(
+                    UpdateOne(
+                        {**key, "date": date},
+                        {
+                            "$setOnInsert": {"location_id": loc["location_id"]},
+                            "$set": {"units": sensor.get("units", "unknown")},
+                            "$push": {"measurements": {"$each": measurements}},
+                        },
+                        upsert=True,
+                    )
+                )
+            stats_ops.append(
+                UpdateMany(
+                    {**key, "date": {"$in": list(by_date)}}, BUCKET_STATS_PIPELINE
+                )
+            )
+
+    return [
+        (LOCATIONS_COLLECTION, location_ops),
+        (BUCKETS_COLLECTION, pull_ops),
+        (BUCKETS_COLLECTION, push_ops),
+        (BUCKETS_COLLECTION, stats_ops),
+    ]
+
+
+def write_bucket_operations(db, phases, batch_size=BULK_BATCH_SIZE):
+    for collection_name, operations in phases:
+        for i in range(0, len(operations), batch_size):
+            db[collection_name].bulk_write(
+                operations[i : i + batch_size], ordered=False
+            )
+
+
+def load_structured_buckets(db, structured, batch_size=BULK_BATCH_SIZE):
+    """Upsert nested-shaped location documents into the bucketed layout."""
+    write_bucket_operations(db, build_bucket_operations(structured), batch_size)
+
+
+# -----------------------------
+# Migration
+# -----------------------------
+
+
+def migrate_nested_to_buckets(db, locations_per_batch=50):
+    """Copy every us_air_data document into the bucketed layout.
+
+    Safe to re-run: buckets are upserted and each hour replaces the stored
+    reading, so already-migrated locations end up unchanged.
+    """
+    batch = []
+    migrated = 0
+    for doc in db[NESTED_COLLECTION].find({}, {"_id": 0}):
+        batch.append(doc)
+        if len(batch) >= locations_per_batch:
+            load_structured_buckets(db, batch)
+            migrated += len(batch)
+            print(f"Migrated {migrated} locations...")
+            batch.clear()
+
+    if batch:
+        load_structured_buckets(db, batch)
+        migrated += len(batch)
+
+    print(f"✔ Migrated {migrated} locations into '{BUCKETS_COLLECTION}'.")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["migrate"]:
+        print("Usage: python -m etl.bucket_store migrate")
+        sys.exit(1)
+    migrate_nested_to_buckets(MongoClient(MONGO_URI)[DB_NAME])
@@ -0,0 +1,14 @@
+from datetime import datetime, timezone
+
+# Marker documents the dashboard polls to invalidate its query cache
+ETL_STATE_COLLECTION = "etl_state"
+LAST_LOAD_ID = "last_load"
+
+
+def mark_data_loaded(db, source):
+    """Record that `source` ("realtime" or "historical") just changed the data."""
+    db[ETL_STATE_COLLECTION].update_one(
+        {"_id": LAST_LOAD_ID},
+        {"$set": {"loaded_at": datetime.now(timezone.utc), "source": source}},
+        upsert=True,
+    )
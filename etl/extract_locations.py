@@ -1,15 +1,18 @@
 import os
-import time
 import json
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
+from etl.openaq_client import get_client, is_retryable_status
 
 # Load API key
 load_dotenv()
 API_KEY = os.getenv("OPENAQ_API_KEY_1")
-HEADERS = {"X-API-Key": API_KEY}
-BASE_URL = "https://api.openaq.org/v3"
+CLIENT = get_client(API_KEY)
+
+# Active-sensor probing config
+PROBE_WORKERS = int(os.getenv("PROBE_WORKERS", "8"))
+CHECKPOINT_BATCH = 50  # Probed locations per output/checkpoint flush
 
 # -----------------------------
 # Location & Sensor Extraction
@@ -23,7 +26,7 @@ def fetch_locations_with_sensors(limit=100, country="United States"):
 
     while True:
         params = {"limit": limit, "page": page}
-        response = requests.get(f"{BASE_URL}/locations", headers=HEADERS, params=params)
+        response = CLIENT.get("/locations", params=params)
         if response.status_code != 200:
             print(f"Error: {response.status_code} — {response.text}")
             break
@@ -54,7 +57,6 @@ def fetch_locations_with_sensors(limit=100, country="United States"):
 
         print(f"Page {page} done. Total collected: {len(all_locations)}")
         page += 1
-        time.sleep(1)
 
     return all_locations
 
@@ -77,51 +79,85 @@ def is_recent(utc_time: str, threshold_hours=48) -> bool:
     return dt >= threshold
 
 
+def fetch_latest_by_sensor(location_id):
+    """Latest reading time (UTC ISO string) per sensor ID, or None on failure.
+
+    Only 429 and 5xx count as failures; a permanent client error (e.g. a 404)
+    means the location has no readings, so it is returned as inactive.
+    """
+    response = CLIENT.get(f"/locations/{location_id}/latest")
+    if response.status_code != 200 and is_retryable_status(response.status_code):
+        print(f"Failed to fetch latest for {location_id} — {response.status_code}")
+        return None
+    if response.status_code != 200:
+        print(f"No latest for {location_id} — {response.status_code}, treating as inactive")
+        return {}
+
+    data = response.json().get("results", [])
+    return {sensor["sensorsId"]: sensor["datetime"]["utc"] for sensor in data}
+
+
+def active_sensor_ids(latest):
+    return [sensor_id for sensor_id, utc in latest.items() if is_recent(utc)]
+
+
+class ProbeError(Exception):
+    """The /latest probe failed, so the location's sensors are unknown."""
+
+
 def filter_active_sensors(location):
-    location_id = location["id"]
-    url = f"{BASE_URL}/locations/{location_id}/latest"
-
-    for attempt in range(5):
-        response = requests.get(url, headers=HEADERS)
-
-        if response.status_code == 200:
-            data = response.json().get("results", [])
-            active_ids = [
-                sensor["sensorsId"]
-                for sensor in data
-                if is_recent(sensor["datetime"]["utc"])
-            ]
-            if active_ids:
-                return {
-                    "id": location["id"],
-                    "name": location["name"],
-                    "country": location["country"],
-                    "locality": location.get("locality"),
-                    "coordinates": location.get("coordinates"),
-                    "active_sensor_ids": active_ids,
-                }
-            return None
-
-        elif response.status_code == 429:
-            wait_time = 10 * (2**attempt)
-            print(f"⚠ Rate limited — retrying in {wait_time}s")
-            time.sleep(wait_time)
-        elif 500 <= response.status_code < 600:
-            print(f"Server error {response.status_code}, skipping...")
-            time.sleep(10)
-            return None
-        else:
-            print(f"Failed to fetch latest for {location_id} — {response.status_code}")
-            return None
-
-    print(f"Max retries exceeded for location {location_id}")
+    """The location with its active sensors, or None if none are active.
+
+    Raises ProbeError when the probe itself fails, so the caller can tell
+    "no active sensors" apart from "not probed" and retry the latter.
+    """
+    latest = fetch_latest_by_sensor(location["id"])
+    if latest is None:
+        raise ProbeError(f"no /latest response for location {location['id']}")
+
+    active_ids = active_sensor_ids(latest)
+    if active_ids:
+        return {
+            "id": location["id"],
+            "name": location["name"],
+            "country": location["country"],
+            "locality": location.get("locality"),
+            "coordinates": location.get("coordinates"),
+            "active_sensor_ids": active_ids,
+        }
     return None
 
 
+def load_processed_ids(output_file, resume_file):
+    """IDs of locations already probed: every checkpointed ID plus every saved hit."""
+    processed = set()
+    if os.path.exists(resume_file):
+        with open(resume_file, "r") as f:
+            processed.update(int(line) for line in f if line.strip())
+    if os.path.exists(output_file):
+        with open(output_file, "r") as f:
+            processed.update(json.loads(line)["id"] for line in f if line.strip())
+    return processed
+
+
+def flush_probe_batch(results, probed_ids, output_file, resume_file):
+    # Hits are written before their IDs are checkpointed; a crash in between is
+    # harmless because saved hits also count as processed on restart
+    if results:
+        with open(output_file, "a") as f:
+            f.writelines(json.dumps(result) + "\n" for result in results)
+    with open(resume_file, "a") as f:
+        f.writelines(f"{location_id}\n" for location_id in probed_ids)
+    results.clear()
+    probed_ids.clear()
+
+
 def filter_and_save_active_locations(
     input_file="data/US_with_sensors.json",
     output_file="data/active_locations_filtered.jsonl",
-    resume_file="data/last_processed_id.txt",
+    resume_file="data/processed_location_ids.txt",
+    workers=PROBE_WORKERS,
+    batch_size=CHECKPOINT_BATCH,
 ):
     os.makedirs("data", exist_ok=True)
 
@@ -132,28 +168,41 @@ def filter_and_save_active_locations(
         print(f"Error reading locations file: {e}")
         return
 
-    resume_id = 0
-    if os.path.exists(resume_file):
-        with open(resume_file, "r") as f:
-            resume_id = int(f.read().strip())
-            print(f"Resuming from location ID {resume_id}")
-
-    for loc in locations:
-        if loc["id"] <= resume_id:
-            continue
-
-        if not loc.get("sensors"):
-            continue
-
-        result = filter_active_sensors(loc)
-        if result:
-            with open(output_file, "a") as f:
-                f.write(json.dumps(result) + "\n")
-            with open(resume_file, "w") as f:
-                f.write(str(loc["id"]))
-            print(
-                f"✔ Saved {result['name']} with {len(result['active_sensor_ids'])} sensors"
-            )
+    processed = load_processed_ids(output_file, resume_file)
+    if processed:
+        print(f"Resuming with {len(processed)} locations already processed")
+
+    pending = [
+        loc for loc in locations if loc.get("sensors") and loc["id"] not in processed
+    ]
+
+    results, probed_ids = [], []
+    failed = 0
+    CLIENT.ensure_pool_size(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(filter_active_sensors, loc): loc for loc in pending}
+        for future in as_completed(futures):
+            loc = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # Not checkpointed, so the location is probed again on restart
+                print(f"⚠ Error probing location {loc['id']}: {e}")
+                failed += 1
+                continue
+
+            probed_ids.append(loc["id"])
+            if result:
+                results.append(result)
+                print(
+                    f"✔ Saved {result['name']} with {len(result['active_sensor_ids'])} sensors"
+                )
+            if len(probed_ids) >= batch_size:
+                flush_probe_batch(results, probed_ids, output_file, resume_file)
+
+    flush_probe_batch(results, probed_ids, output_file, resume_file)
+    if failed:
+        print(f"⚠ {failed} locations could not be probed; re-run to retry them")
 
 
 # -----------------------------
@@ -1,27 +1,35 @@
 import os
-import time
 import json
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from etl.openaq_client import get_client, is_retryable_status
+from etl.raw_store import write_sensor_batch, compact_parquet, RAW_STORE_FORMAT
 
 # Load API key and config
 load_dotenv()
 API_KEY = os.getenv("OPENAQ_API_KEY_1")
-HEADERS = {"X-API-Key": API_KEY}
-BASE_URL = "https://api.openaq.org/v3/sensors/{}/measurements"
+MEASUREMENTS_PATH = "/sensors/{}/measurements"
 
 # File paths
 ACTIVE_FILE = "data/active_locations_filtered.jsonl"
 RESUME_FILE = "data/sensor_resume_checkpoint.txt"
-OUTPUT_DIR = "data/data_by_sensor"
+WINDOW_RESUME_FILE = "data/sensor_window_checkpoint.txt"
 
 # Extraction config
-CHUNK_DAYS = 3
-LIMIT = 100
-MAX_PAGES = 1  # To prevent runaway pagination
+FETCH_MODE = os.getenv("EXTRACT_FETCH_MODE", "window")  # "window" or "chunked"
+CHUNK_DAYS = 3  # Fixed chunk size ("chunked"), first chunk size ("window")
+LIMIT = 1000  # API maximum page size
+MAX_PAGES = 100  # To prevent runaway pagination
+TARGET_CHUNK_ROWS = 5 * LIMIT  # Adaptive chunks aim for about five pages each
+WINDOW_DAYS = 90
 END_DATE = datetime.now(timezone.utc)
-START_DATE = END_DATE - timedelta(days=90)
+START_DATE = END_DATE - timedelta(days=WINDOW_DAYS)
+CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "8"))  # Fetches kept in flight
+
+# Shared keep-alive client, with a connection for every worker thread
+CLIENT = get_client(API_KEY, pool_size=CONCURRENCY)
 
 
 # Load all sensors from active locations
@@ -61,11 +69,52 @@ def load_resume():
     return None, None
 
 
-# Fetch data for one sensor and one 3-day chunk
+def save_resume(chunk_end, sensor_id):
+    with open(RESUME_FILE, "w") as f:
+        f.write(f"{chunk_end.strftime('%Y-%m-%dT%H:%M:%SZ')},{sensor_id}")
+
+
+# Window-mode checkpoint: oldest boundary already saved for each sensor
+def load_window_resume():
+    done_until = {}
+    if os.path.exists(WINDOW_RESUME_FILE):
+        with open(WINDOW_RESUME_FILE, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                sensor_id_str, date_str = line.strip().split(",")
+                boundary = datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%SZ").replace(
+                    tzinfo=timezone.utc
+                )
+                sensor_id = int(sensor_id_str)
+                done_until[sensor_id] = min(
+                    boundary, done_until.get(sensor_id, boundary)
+                )
+    return done_until
+
+
+_window_resume_lock = threading.Lock()
+
+
+def save_window_resume(sensor_id, boundary):
+    with _window_resume_lock:
+        with open(WINDOW_RESUME_FILE, "a") as f:
+            f.write(f"{sensor_id},{boundary.strftime('%Y-%m-%dT%H:%M:%SZ')}\n")
+
+
+class FetchError(Exception):
+    """A chunk could not be fetched completely; it must not be checkpointed."""
+
+
+# Fetch every page of data for one sensor and one chunk
 def fetch_measurements(sensor_id, dt_from, dt_to):
+    """All measurements for the chunk; raises FetchError if any page fails.
+
+    Permanent client errors (e.g. a 404 for a retired sensor) mean the sensor
+    has no data, so they end the fetch instead of failing the chunk.
+    """
     page = 1
     results = []
-    retry_delay = 10
 
     while page <= MAX_PAGES:
         params = {
@@ -75,36 +124,139 @@ def fetch_measurements(sensor_id, dt_from, dt_to):
             "page": page,
         }
         try:
-            response = requests.get(
-                BASE_URL.format(sensor_id), headers=HEADERS, params=params
-            )
-            if response.status_code == 200:
-                data = response.json().get("results", [])
-                if not data:
-                    break
-                results.extend(data)
-                if len(data) < LIMIT:
-                    break
-                page += 1
-                time.sleep(0.4)
-            elif response.status_code == 429:
-                print(
-                    f"⚠ Rate limit hit for sensor {sensor_id}. Retrying in {retry_delay}s..."
-                )
-                time.sleep(retry_delay)
-                retry_delay *= 2
-            else:
-                print(f"⚠ HTTP {response.status_code} for sensor {sensor_id}")
+            response = CLIENT.get(MEASUREMENTS_PATH.format(sensor_id), params=params)
+            status = response.status_code
+            if status != 200 and is_retryable_status(status):
+                raise FetchError(f"HTTP {status} on page {page}")
+            if status != 200:
+                print(f"⚠ HTTP {status} for sensor {sensor_id}, skipping it")
                 break
+            data = response.json().get("results", [])
+        except FetchError:
+            raise
         except Exception as e:
-            print(f"⚠ Error fetching sensor {sensor_id}: {e}")
+            raise FetchError(f"page {page}: {e}") from e
+        if not data:
             break
+        results.extend(data)
+        if len(data) < LIMIT:
+            break
+        page += 1
+    else:
+        print(f"⚠ Sensor {sensor_id} hit MAX_PAGES, results truncated at {dt_from}")
     return results
 
 
-# Main extraction loop
-def extract_all_measurements():
-    all_sensors = load_all_sensors()
+# Keep only well-formed entries, flattened to the fields we store
+def parse_entries(entries):
+    valid_entries = []
+    for e in entries:
+        if not all(
+            [
+                e.get("value") is not None,
+                "parameter" in e,
+                "period" in e,
+                "datetimeFrom" in e["period"],
+                "utc" in e["period"]["datetimeFrom"],
+            ]
+        ):
+            continue
+        valid_entries.append(
+            {
+                "datetime": e["period"]["datetimeFrom"]["utc"],
+                "parameter": e["parameter"]["name"],
+                "value": e["value"],
+            }
+        )
+    return valid_entries
+
+
+# Fetch, validate and append one sensor/chunk (runs in a worker thread)
+def process_sensor_chunk(sensor, chunk_start, chunk_end):
+    sensor_id = sensor["sensor_id"]
+    print(f"Fetching sensor {sensor_id} ({sensor['location_name']})...")
+
+    valid_entries = parse_entries(fetch_measurements(sensor_id, chunk_start, chunk_end))
+    if valid_entries:
+        write_sensor_batch(sensor_id, valid_entries)
+        print(f"✔ Saved {len(valid_entries)} entries for sensor {sensor_id}")
+    else:
+        print(f"⚠ No valid data for sensor {sensor_id}")
+
+
+# Size the next chunk to hold about TARGET_CHUNK_ROWS at the observed density
+def next_chunk_days(rows, days):
+    if rows == 0:
+        return WINDOW_DAYS
+    return min(max(TARGET_CHUNK_ROWS * days / rows, 1), WINDOW_DAYS)
+
+
+# Walk one sensor's whole window back from `chunk_end` (runs in a worker thread)
+def process_sensor_window(sensor, chunk_end):
+    sensor_id = sensor["sensor_id"]
+    print(f"Fetching sensor {sensor_id} ({sensor['location_name']})...")
+
+    saved = 0
+    chunk_days = CHUNK_DAYS
+    while chunk_end > START_DATE:
+        chunk_start = max(chunk_end - timedelta(days=chunk_days), START_DATE)
+        try:
+            entries = fetch_measurements(sensor_id, chunk_start, chunk_end)
+        except FetchError as e:
+            # Stop here without checkpointing, so a restart refetches this chunk
+            print(f"⚠ Error fetching sensor {sensor_id} before {chunk_end}: {e}")
+            break
+        valid_entries = parse_entries(entries)
+        if valid_entries:
+            write_sensor_batch(sensor_id, valid_entries)
+            saved += len(valid_entries)
+        save_window_resume(sensor_id, chunk_start)
+
+        chunk_days = next_chunk_days(
+            len(entries), (chunk_end - chunk_start) / timedelta(days=1)
+        )
+        chunk_end = chunk_start
+
+    if saved:
+        print(f"✔ Saved {saved} entries for sensor {sensor_id}")
+    else:
+        print(f"⚠ No valid data for sensor {sensor_id}")
+
+
+# Fetch one chunk for many sensors concurrently; True if every sensor succeeded
+def extract_chunk(sensors, chunk_start, chunk_end, executor):
+    done = [False] * len(sensors)
+    checkpointed = 0  # Length of the finished prefix of `sensors`
+    failed = 0
+
+    futures = {
+        executor.submit(process_sensor_chunk, sensor, chunk_start, chunk_end): index
+        for index, sensor in enumerate(sensors)
+    }
+    for future in as_completed(futures):
+        index = futures[future]
+        try:
+            future.result()
+        except Exception as e:
+            # Left unfinished, so the checkpoint never moves past this sensor
+            print(f"⚠ Error processing sensor {sensors[index]['sensor_id']}: {e}")
+            failed += 1
+            continue
+        done[index] = True
+
+        # Only checkpoint the contiguous finished prefix, so a restart never
+        # skips a sensor that was still in flight
+        advanced = checkpointed
+        while advanced < len(sensors) and done[advanced]:
+            advanced += 1
+        if advanced > checkpointed:
+            checkpointed = advanced
+            save_resume(chunk_end, sensors[advanced - 1]["sensor_id"])
+
+    return failed == 0
+
+
+def extract_chunked(all_sensors, executor):
     resume_date, resume_sensor_id = load_resume()
 
     curr_date = resume_date if resume_date else END_DATE
@@ -113,71 +265,53 @@ def extract_all_measurements():
         chunk_start = chunk_end - timedelta(days=CHUNK_DAYS)
         print(f"\nProcessing chunk: {chunk_start.date()} to {chunk_end.date()}")
 
-        found_resume_sensor = (
-            False if resume_date and chunk_end == resume_date else True
-        )
+        sensors = all_sensors
+        if resume_date and chunk_end == resume_date:
+            ids = [s["sensor_id"] for s in all_sensors]
+            if resume_sensor_id in ids:
+                skip = ids.index(resume_sensor_id) + 1
+                print(f"Skipping {skip} sensors already saved for this chunk")
+                sensors = all_sensors[skip:]
 
-        for sensor in all_sensors:
-            sensor_id = sensor["sensor_id"]
+        if not extract_chunk(sensors, chunk_start, chunk_end, executor):
+            # The checkpoint is one position, so stop rather than leave a gap
+            print("⚠ Some sensors failed for this chunk; re-run to resume from them")
+            return
 
-            if not found_resume_sensor:
-                if sensor_id == resume_sensor_id:
-                    found_resume_sensor = True
-                else:
-                    print(
-                        f"Skipping sensor {sensor_id} for {chunk_start.date()} to {chunk_end.date()}"
-                    )
-                    continue
+        resume_date, resume_sensor_id = None, None
+        curr_date -= timedelta(days=CHUNK_DAYS)
 
-            sensor_path = os.path.join(OUTPUT_DIR, f"sensor_{sensor_id}")
-            os.makedirs(sensor_path, exist_ok=True)
-            out_file = os.path.join(sensor_path, f"sensor_{sensor_id}.jsonl")
-
-            print(f"Fetching sensor {sensor_id} ({sensor['location_name']})...")
-
-            try:
-                entries = fetch_measurements(sensor_id, chunk_start, chunk_end)
-                valid_entries = []
-                for e in entries:
-                    if not all(
-                        [
-                            e.get("value") is not None,
-                            "parameter" in e,
-                            "period" in e,
-                            "datetimeFrom" in e["period"],
-                            "utc" in e["period"]["datetimeFrom"],
-                        ]
-                    ):
-                        continue
-                    valid_entries.append(
-                        {
-                            "datetime": e["period"]["datetimeFrom"]["utc"],
-                            "parameter": e["parameter"]["name"],
-                            "value": e["value"],
-                        }
-                    )
 
-                if valid_entries:
-                    with open(out_file, "a", encoding="utf-8") as f_out:
-                        for v in valid_entries:
-                            f_out.write(json.dumps(v) + "\n")
-                    print(
-                        f"✔ Saved {len(valid_entries)} entries for sensor {sensor_id}"
-                    )
-                else:
-                    print(f"⚠ No valid data for sensor {sensor_id}")
+# Fetch each sensor's full window with adaptive chunks, sensors concurrently
+def extract_windows(all_sensors, executor):
+    done_until = load_window_resume()
 
-                with open(RESUME_FILE, "w") as f:
-                    f.write(f"{chunk_end.strftime('%Y-%m-%dT%H:%M:%SZ')},{sensor_id}")
+    futures = {}
+    for sensor in all_sensors:
+        chunk_end = done_until.get(sensor["sensor_id"], END_DATE)
+        if chunk_end > START_DATE:
+            futures[executor.submit(process_sensor_window, sensor, chunk_end)] = sensor
+    for future in as_completed(futures):
+        try:
+            future.result()
+        except Exception as e:
+            print(f"⚠ Error processing sensor {futures[future]['sensor_id']}: {e}")
 
-                time.sleep(0.5)
 
-            except Exception as e:
-                print(f"⚠ Error processing sensor {sensor_id}: {e}")
+# Main extraction entry point
+def extract_all_measurements(concurrency=CONCURRENCY, mode=FETCH_MODE):
+    all_sensors = load_all_sensors()
 
-        resume_date, resume_sensor_id = None, None
-        curr_date -= timedelta(days=CHUNK_DAYS)
+    CLIENT.ensure_pool_size(concurrency)  # One connection per worker thread
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if mode == "window":
+            extract_windows(all_sensors, executor)
+        else:
+            extract_chunked(all_sensors, executor)
 
+    if RAW_STORE_FORMAT == "parquet":
+        removed = compact_parquet([s["sensor_id"] for s in all_sensors])
+        print(f"Compacted {removed} Parquet part files")
     print("\n✔ Historical extraction complete.")
 
 
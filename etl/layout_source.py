@@ -0,0 +1,88 @@
+import os
+from collections import defaultdict
+from dotenv import load_dotenv
+from etl.nested_store import NESTED_COLLECTION
+from etl.bucket_store import LOCATIONS_COLLECTION, BUCKETS_COLLECTION
+from etl.timeseries_store import TIMESERIES_COLLECTION
+
+# Reads any storage layout back as nested-shaped location documents, the shape
+# every loader, rollup and marker update accepts, for the rebuild commands
+load_dotenv()
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "nested")  # nested|bucketed|timeseries
+
+
+def _with_measurements(locations, readings):
+    """Attach (location_id, sensor_id, parameter) -> measurements to metadata."""
+    for loc in locations:
+        loc["sensors"] = [
+            {
+                **sensor,
+                "measurements": readings.get(
+                    (loc["location_id"], sensor["sensor_id"], sensor["parameter"]), []
+                ),
+            }
+            for sensor in loc.get("sensors", [])
+        ]
+    return locations
+
+
+def _bucketed_measurements(db, location_ids):
+    readings = defaultdict(list)
+    cursor = db[BUCKETS_COLLECTION].find(
+        {"location_id": {"$in": location_ids}}, {"_id": 0}
+    )
+    for bucket in cursor.sort("date", 1):
+        key = (bucket["location_id"], bucket["sensor_id"], bucket["parameter"])
+        readings[key].extend(
+            {"date": bucket["date"], "hour": m["hour"], "value": m["value"]}
+            for m in bucket["measurements"]
+        )
+    return readings
+
+
+def _timeseries_measurements(db, location_ids):
+    readings = defaultdict(list)
+    cursor = db[TIMESERIES_COLLECTION].find(
+        {"meta.location_id": {"$in": location_ids}}, {"_id": 0}
+    )
+    for doc in cursor.sort("datetime", 1):
+        meta = doc["meta"]
+        key = (meta["location_id"], meta["sensor_id"], meta["parameter"])
+        readings[key].append(
+            {
+                "date": doc["datetime"].strftime("%Y-%m-%d"),
+                "hour": doc["datetime"].hour,
+                "value": doc["value"],
+            }
+        )
+    return readings
+
+
+MEASUREMENT_READERS = {
+    "bucketed": _bucketed_measurements,
+    "timeseries": _timeseries_measurements,
+}
+
+
+def iter_structured_batches(db, layout=STORAGE_LAYOUT, locations_per_batch=50):
+    """Yield lists of nested-shaped location documents stored in `layout`."""
+    if layout in MEASUREMENT_READERS:
+        source = db[LOCATIONS_COLLECTION].find({}, {"_id": 0, "content_hash": 0})
+    else:
+        source = db[NESTED_COLLECTION].find({}, {"_id": 0})
+
+    batch = []
+    for doc in source:
+        batch.append(doc)
+        if len(batch) >= locations_per_batch:
+            yield _complete(db, layout, batch)
+            batch = []
+    if batch:
+        yield _complete(db, layout, batch)
+
+
+def _complete(db, layout, batch):
+    if layout not in MEASUREMENT_READERS:
+        return batch
+    ids = [loc["location_id"] for loc in batch]
+    return _with_measurements(batch, MEASUREMENT_READERS[layout](db, ids))
@@ -1,8 +1,23 @@
 import os
+import json
+import hashlib
+import threading
 import ijson
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from dotenv import load_dotenv
+from etl.bucket_store import (
+    load_structured_buckets,
+    LOCATIONS_COLLECTION,
+    BUCKETS_COLLECTION,
+)
+from etl.nested_store import load_structured_nested
+from etl.timeseries_store import load_structured_timeseries, TIMESERIES_COLLECTION
+from etl.mongo_indexes import ensure_indexes
+from etl.rollup_store import update_rollups
+from etl.marker_store import refresh_markers
+from etl.etl_state import mark_data_loaded
 
 # Load environment variables
 load_dotenv()
@@ -11,6 +26,34 @@ DB_NAME = "air_quality"
 COLLECTION_NAME = "us_air_data"
 INPUT_FILE = "data/US_data_structured_cleaned.json"
 BATCH_SIZE = 500
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "nested")  # nested|bucketed|timeseries
+LOAD_MODE = os.getenv("LOAD_MODE", "parallel")  # "parallel", "serial" or "upsert"
+LOAD_CHECKPOINT_FILE = "data/load_checkpoint.txt"  # Locations upserted so far
+
+# Parallel load config
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "4"))  # Concurrent writer connections
+TARGET_BATCH_BYTES = 8 * 1024 * 1024  # BSON bytes per write; 48MB is the wire limit
+MAX_BATCH_DOCS = 1000
+# Approximate BSON bytes per part of a location document, for batch sizing
+LOCATION_BSON_BYTES = 256
+SENSOR_BSON_BYTES = 100
+MEASUREMENT_BSON_BYTES = 56  # {date, hour, value} plus its array index key
+
+# Collections cleared and loaders used for the non-nested layouts
+LAYOUT_TARGETS = {
+    "bucketed": [LOCATIONS_COLLECTION, BUCKETS_COLLECTION],
+    "timeseries": [LOCATIONS_COLLECTION, TIMESERIES_COLLECTION],
+}
+LAYOUT_LOADERS = {
+    "bucketed": load_structured_buckets,
+    "timeseries": load_structured_timeseries,
+}
+
+
+def update_derived(db, batch):
+    """Fold a loaded batch into the rollups and the map markers."""
+    update_rollups(db, batch)
+    refresh_markers(db, batch)
 
 
 def connect_to_mongo(uri=MONGO_URI, db_name=DB_NAME, collection_name=COLLECTION_NAME):
@@ -40,26 +83,287 @@ def load_json_to_mongo(file_path, collection, batch_size=BATCH_SIZE):
 
             if len(batch) >= batch_size:
                 collection.insert_many(batch)
+                update_derived(collection.database, batch)
                 print(f"Inserted {len(batch)} records...")
                 batch.clear()
 
     if batch:
         collection.insert_many(batch)
+        update_derived(collection.database, batch)
         print(f"Inserted final {len(batch)} records.")
 
     print("✔ All records inserted into MongoDB.")
 
 
+def load_json_to_layout(file_path, db, layout=STORAGE_LAYOUT, batch_size=BATCH_SIZE):
+    """Load nested-shaped locations through the bucketed or timeseries writer."""
+    load_structured = LAYOUT_LOADERS[layout]
+    batch = []
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        for record in ijson.items(f, "item"):
+            batch.append(convert_decimals(record))
+
+            if len(batch) >= batch_size:
+                load_structured(db, batch)
+                update_derived(db, batch)
+                print(f"Loaded {len(batch)} locations ({layout})...")
+                batch.clear()
+
+    if batch:
+        load_structured(db, batch)
+        update_derived(db, batch)
+        print(f"Loaded final {len(batch)} locations ({layout}).")
+
+    print(f"✔ All locations loaded into the {layout} layout.")
+
+
+# -----------------------------
+# Parallel load
+# -----------------------------
+
+
+def iter_records(file_path):
+    # The float backend yields plain floats, so no Decimal conversion pass
+    with open(file_path, "rb") as f:
+        yield from ijson.items(f, "item", use_float=True)
+
+
+def estimated_bson_size(record):
+    """Approximate BSON size of a location document, without encoding it.
+
+    pymongo encodes every document when it is written, so encoding it here
+    as well would double the CPU spent on serialization. The per-measurement
+    size dominates and varies little, so the estimate is close enough to size
+    batches by.
+    """
+    return LOCATION_BSON_BYTES + sum(
+        SENSOR_BSON_BYTES + MEASUREMENT_BSON_BYTES * len(s.get("measurements", []))
+        for s in record.get("sensors", [])
+    )
+
+
+def byte_batches(records, target_bytes=TARGET_BATCH_BYTES, max_docs=MAX_BATCH_DOCS):
+    """Group records into batches of about `target_bytes` of BSON.
+
+    Location documents vary from a few KB to several MB depending on how many
+    sensors and hours they hold, so a fixed record count gives either tiny
+    writes or oversized ones.
+    """
+    batch, size = [], 0
+    for record in records:
+        batch.append(record)
+        size += estimated_bson_size(record)
+        if size >= target_bytes or len(batch) >= max_docs:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def write_parallel(batches, write, workers=LOAD_WORKERS):
+    """Call `write(batch)` from `workers` threads while `batches` is consumed here.
+
+    The client's connection pool gives each writer its own connection. At most
+    two batches per worker are buffered, so memory stays bounded however far
+    parsing runs ahead. Returns the number of records written.
+    """
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    progress_lock = threading.Lock()
+    loaded = 0
+
+    def run(batch):
+        nonlocal loaded
+        try:
+            write(batch)
+        finally:
+            in_flight.release()
+        with progress_lock:
+            loaded += len(batch)
+            print(f"Loaded {loaded} locations...")
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in batches:
+            in_flight.acquire()
+            futures.append(executor.submit(run, batch))
+
+    # Surface the first write error, if any, after every batch has finished
+    for future in futures:
+        future.result()
+    return loaded
+
+
+def load_json_parallel(
+    file_path,
+    db,
+    layout=STORAGE_LAYOUT,
+    workers=LOAD_WORKERS,
+    target_bytes=TARGET_BATCH_BYTES,
+):
+    """Insert every location with unordered writes from `workers` threads."""
+    if layout in LAYOUT_LOADERS:
+        load_structured = LAYOUT_LOADERS[layout]
+
+        def write(batch):
+            load_structured(db, batch)
+            update_derived(db, batch)
+
+    else:
+        collection = db[COLLECTION_NAME]
+
+        def write(batch):
+            collection.insert_many(batch, ordered=False)
+            update_derived(db, batch)
+
+    batches = byte_batches(iter_records(file_path), target_bytes)
+    loaded = write_parallel(batches, write, workers)
+    print(f"✔ All {loaded} locations loaded ({layout}, {workers} writers).")
+
+
+# -----------------------------
+# Resumable upsert load
+# -----------------------------
+
+
+def content_hash(record):
+    """Stable fingerprint of a location document, used to skip unchanged ones."""
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def input_fingerprint(file_path):
+    """Identifies one version of the input file: path, mtime and size."""
+    stat = os.stat(file_path)
+    return f"{os.path.abspath(file_path)} {stat.st_mtime_ns} {stat.st_size}"
+
+
+def load_checkpoint(file_path, checkpoint_file=LOAD_CHECKPOINT_FILE):
+    """Location IDs already loaded from this version of `file_path`.
+
+    The checkpoint's first line records the input it was written for; one
+    left over from a different or since-rewritten file is discarded.
+    """
+    if not os.path.exists(checkpoint_file):
+        return set()
+    with open(checkpoint_file) as f:
+        if f.readline().strip() == f"# {input_fingerprint(file_path)}":
+            return {int(line) for line in f if line.strip()}
+    print(f"Discarding {checkpoint_file}: it was written for another input")
+    os.remove(checkpoint_file)
+    return set()
+
+
+_checkpoint_lock = threading.Lock()
+
+
+def save_checkpoint(location_ids, file_path, checkpoint_file=LOAD_CHECKPOINT_FILE):
+    with _checkpoint_lock:
+        new = not os.path.exists(checkpoint_file)
+        with open(checkpoint_file, "a") as f:
+            if new:
+                f.write(f"# {input_fingerprint(file_path)}\n")
+            f.writelines(f"{location_id}\n" for location_id in location_ids)
+
+
+def load_json_upsert(
+    file_path,
+    db,
+    layout=STORAGE_LAYOUT,
+    workers=LOAD_WORKERS,
+    checkpoint_file=LOAD_CHECKPOINT_FILE,
+):
+    """Upsert changed locations by location_id, resuming after a crash.
+
+    Each location's content hash is stored with its document (the locations
+    collection for the bucketed and timeseries layouts). Locations whose hash
+    is unchanged are skipped, and so are locations already listed in the
+    checkpoint file for this input. Changed locations are merged into what is
+    stored: metadata is overwritten and each hour in the file replaces the
+    stored reading, so readings for other hours (e.g. from realtime loads) are
+    kept. The checkpoint is removed once the whole file is loaded.
+    """
+    target = db[LOCATIONS_COLLECTION if layout in LAYOUT_LOADERS else COLLECTION_NAME]
+    load_structured = LAYOUT_LOADERS.get(layout, load_structured_nested)
+    stored_hashes = {
+        doc["location_id"]: doc.get("content_hash")
+        for doc in target.find({}, {"_id": 0, "location_id": 1, "content_hash": 1})
+    }
+    completed = load_checkpoint(file_path, checkpoint_file)
+    if completed:
+        print(f"Resuming: {len(completed)} locations already loaded")
+    skipped = 0
+
+    def changed_records():
+        nonlocal skipped
+        for record in iter_records(file_path):
+            if record["location_id"] in completed:
+                continue
+            record["content_hash"] = content_hash(record)
+            if stored_hashes.get(record["location_id"]) == record["content_hash"]:
+                skipped += 1
+                continue
+            yield record
+
+    def write(batch):
+        load_structured(db, batch)
+        update_derived(db, batch)
+        # The hash is recorded only after the location's data is written
+        target.bulk_write(
+            [
+                UpdateOne(
+                    {"location_id": r["location_id"]},
+                    {"$set": {"content_hash": r["content_hash"]}},
+                )
+                for r in batch
+            ],
+            ordered=False,
+        )
+        save_checkpoint([r["location_id"] for r in batch], file_path, checkpoint_file)
+
+    loaded = write_parallel(byte_batches(changed_records()), write, workers)
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    print(f"✔ Upserted {loaded} changed locations, {skipped} unchanged ({layout}).")
+
+
 def main():
     collection = connect_to_mongo()
+    db = collection.database
+    targets = [
+        db[name] for name in LAYOUT_TARGETS.get(STORAGE_LAYOUT, [COLLECTION_NAME])
+    ]
+
+    if LOAD_MODE == "upsert":
+        # Non-interactive and safe to re-run: nothing is cleared or duplicated
+        ensure_indexes(db, STORAGE_LAYOUT)
+        load_json_upsert(INPUT_FILE, db, STORAGE_LAYOUT, LOAD_WORKERS)
+        mark_data_loaded(db, "historical")
+        return
 
     clear = input("Clear existing collection? (y/n): ").strip().lower()
-    if clear == "y":
-        result = collection.delete_many({})
-        print(f"Cleared {result.deleted_count} existing documents from the collection.")
+    if clear != "y":
+        # Appending would duplicate stored locations, so merge into them instead
+        print("Keeping existing documents; upserting changed locations into them...")
+        ensure_indexes(db, STORAGE_LAYOUT)
+        load_json_upsert(INPUT_FILE, db, STORAGE_LAYOUT, LOAD_WORKERS)
+        mark_data_loaded(db, "historical")
+        return
+
+    for target in targets:
+        result = target.delete_many({})
+        print(f"Cleared {result.deleted_count} existing documents from '{target.name}'.")
 
+    # Upserts need their key indexes; later inserts also keep them up to date
+    ensure_indexes(db, STORAGE_LAYOUT)
     print("Starting MongoDB batch load...")
-    load_json_to_mongo(INPUT_FILE, collection, BATCH_SIZE)
+    if LOAD_MODE == "parallel":
+        load_json_parallel(INPUT_FILE, db, STORAGE_LAYOUT, LOAD_WORKERS)
+    elif STORAGE_LAYOUT in LAYOUT_LOADERS:
+        load_json_to_layout(INPUT_FILE, db, STORAGE_LAYOUT, BATCH_SIZE)
+    else:
+        load_json_to_mongo(INPUT_FILE, collection, BATCH_SIZE)
+    mark_data_loaded(db, "historical")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pymongo import MongoClient, UpdateOne, UpdateMany
+from dotenv import load_dotenv
+from etl.layout_source import iter_structured_batches
+from etl.parameter_bands import get_safety_label
+
+# Precomputed map markers: one small document per location with its latest
+# reading per parameter, so the dashboard map never scans measurement data
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DB_NAME = "air_quality"
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "nested")  # nested|bucketed|timeseries
+MARKERS_COLLECTION = "location_markers"
+BULK_BATCH_SIZE = int(os.getenv("MONGO_BULK_BATCH_SIZE", "1000"))
+
+# Parameter a marker is coloured by: the first one the location reports
+MARKER_PARAMETERS = ["pm25", "pm10", "o3", "no2", "so2", "co"]
+
+# Picks the marker's headline reading from its latest readings
+PRIMARY_READING_PIPELINE = [
+    {
+        "$set": {
+            "primary": {"$ifNull": [f"$latest.{p}" for p in MARKER_PARAMETERS] + [None]}
+        }
+    },
+    {
+        "$set": {
+            "parameter": "$primary.parameter",
+            "value": "$primary.value",
+            "category": {"$ifNull": ["$primary.category", "Unknown"]},
+            "datetime": "$primary.datetime",
+        }
+    },
+    {"$unset": "primary"},
+]
+
+
+def latest_readings(loc):
+    """Most recent measurement per parameter across a location's sensors."""
+    latest = {}
+    for sensor in loc.get("sensors", []):
+        parameter = sensor["parameter"]
+        for m in sensor.get("measurements", []):
+            if m["value"] is None:
+                continue
+            day = datetime.strptime(m["date"], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            measured_at = day + timedelta(hours=m["hour"])
+            if parameter not in latest or measured_at > latest[parameter]["datetime"]:
+                latest[parameter] = {
+                    "parameter": parameter,
+                    "value": m["value"],
+                    "units": sensor.get("units", "unknown"),
+                    "datetime": measured_at,
+                }
+    for reading in latest.values():
+        reading["category"] = get_safety_label(reading["value"], reading["parameter"])
+    return latest
+
+
+def build_marker_operations(structured):
+    """Phased marker updates for nested-shaped location documents.
+
+    A reading only replaces the stored one for its parameter when it is newer,
+    so replaying an older batch never moves a marker back in time.
+    """
+    location_ops, reading_ops = [], []
+    touched = []
+    for loc in structured:
+        coords = loc.get("coordinates")
+        if not coords:
+            continue
+        location_ops.append(
+            UpdateOne(
+                {"location_id": loc["location_id"]},
+                {
+                    "$set": {
+                        "location_name": loc["location_name"],
+                        "locality": loc.get("locality"),
+                        "lat": coords["latitude"],
+                        "lon": coords["longitude"],
+                    }
+                },
+                upsert=True,
+            )
+        )
+        for parameter, reading in latest_readings(loc).items():
+            field = f"latest.{parameter}"
+            reading_ops.append(
+                UpdateOne(
+                    {
+                        "location_id": loc["location_id"],
+                        "$or": [
+                            {field: {"$exists": False}},
+                            {f"{field}.datetime": {"$lt": reading["datetime"]}},
+                        ],
+                    },
+                    {"$set": {field: reading}},
+                )
+            )
+        touched.append(loc["location_id"])
+
+    primary_ops = []
+    if touched:
+        primary_ops.append(
+            UpdateMany({"location_id": {"$in": touched}}, PRIMARY_READING_PIPELINE)
+        )
+    return [location_ops, reading_ops, primary_ops]
+
+
+def refresh_markers(db, structured, batch_size=BULK_BATCH_SIZE):
+    """Fold a batch of loaded locations into the marker collection."""
+    markers = db[MARKERS_COLLECTION]
+    for operations in build_marker_operations(structured):
+        for i in range(0, len(operations), batch_size):
+            markers.bulk_write(operations[i : i + batch_size], ordered=False)
+
+
+# -----------------------------
+# Rebuild
+# -----------------------------
+
+
+def rebuild(db, layout=STORAGE_LAYOUT, locations_per_batch=50):
+    """Build markers for everything already stored in `layout` (safe to re-run)."""
+    rebuilt = 0
+    for batch in iter_structured_batches(db, layout, locations_per_batch):
+        refresh_markers(db, batch)
+        rebuilt += len(batch)
+        print(f"Refreshed markers for {rebuilt} locations...")
+
+    print(f"✔ Refreshed markers for {rebuilt} locations ({layout}).")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("Usage: python -m etl.marker_store rebuild")
+        sys.exit(1)
+    # Imported here: etl.mongo_indexes itself imports this module's constants
+    from etl.mongo_indexes import ensure_indexes
+
+    db = MongoClient(MONGO_URI)[DB_NAME]
+    ensure_indexes(db, STORAGE_LAYOUT)  # marker upserts match on the unique location_id
+    rebuild(db, STORAGE_LAYOUT)
@@ -0,0 +1,287 @@
+import os
+import sys
+from datetime import datetime
+from pymongo import MongoClient, ASCENDING
+from dotenv import load_dotenv
+from etl.bucket_store import LOCATIONS_COLLECTION, BUCKETS_COLLECTION
+from etl.nested_store import dedupe_locations
+from etl.timeseries_store import TIMESERIES_COLLECTION, ensure_timeseries_collection
+from etl.rollup_store import DAILY_COLLECTION, PERIOD_COLLECTION, PROFILE_COLLECTION
+from etl.marker_store import MARKERS_COLLECTION
+
+# Index management for every storage layout, plus an explain()-based check that
+# the ETL and dashboard queries are served by an index
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DB_NAME = "air_quality"
+COLLECTION_NAME = "us_air_data"
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "nested")  # nested|bucketed|timeseries
+
+# (collection, keys, options) per layout
+LOCATION_INDEXES = [
+    (LOCATIONS_COLLECTION, [("location_id", ASCENDING)], {"unique": True}),
+    (LOCATIONS_COLLECTION, [("location_name", ASCENDING)], {}),
+]
+# Rollups are kept for every layout; the unique keys double as $merge targets
+ROLLUP_INDEXES = [
+    (
+        DAILY_COLLECTION,
+        [("sensor_id", ASCENDING), ("parameter", ASCENDING), ("date", ASCENDING)],
+        {"unique": True},
+    ),
+    (
+        DAILY_COLLECTION,
+        [("location_id", ASCENDING), ("parameter", ASCENDING), ("date", ASCENDING)],
+        {},
+    ),
+    (
+        PERIOD_COLLECTION,
+        [
+            ("sensor_id", ASCENDING),
+            ("parameter", ASCENDING),
+            ("period", ASCENDING),
+            ("date", ASCENDING),
+        ],
+        {"unique": True},
+    ),
+    (
+        PERIOD_COLLECTION,
+        [
+            ("location_id", ASCENDING),
+            ("parameter", ASCENDING),
+            ("period", ASCENDING),
+            ("date", ASCENDING),
+        ],
+        {},
+    ),
+    (
+        PROFILE_COLLECTION,
+        [("sensor_id", ASCENDING), ("parameter", ASCENDING), ("month", ASCENDING)],
+        {"unique": True},
+    ),
+    (
+        PROFILE_COLLECTION,
+        [("location_id", ASCENDING), ("parameter", ASCENDING), ("month", ASCENDING)],
+        {},
+    ),
+]
+MARKER_INDEXES = [
+    (MARKERS_COLLECTION, [("location_id", ASCENDING)], {"unique": True}),
+]
+INDEXES = {
+    "nested": [
+        (COLLECTION_NAME, [("location_id", ASCENDING)], {"unique": True}),
+        (
+            COLLECTION_NAME,
+            [("location_id", ASCENDING), ("sensors.sensor_id", ASCENDING)],
+            {},
+        ),
+        (COLLECTION_NAME, [("location_name", ASCENDING)], {}),
+    ]
+    + ROLLUP_INDEXES
+    + MARKER_INDEXES,
+    "bucketed": LOCATION_INDEXES
+    + [
+        (
+            BUCKETS_COLLECTION,
+            [("sensor_id", ASCENDING), ("parameter", ASCENDING), ("date", ASCENDING)],
+            {"unique": True},
+        ),
+        (
+            BUCKETS_COLLECTION,
+            [
+                ("location_id", ASCENDING),
+                ("parameter", ASCENDING),
+                ("date", ASCENDING),
+            ],
+            {},
+        ),
+    ]
+    + ROLLUP_INDEXES
+    + MARKER_INDEXES,
+    "timeseries": LOCATION_INDEXES
+    + [
+        (
+            TIMESERIES_COLLECTION,
+            [
+                ("meta.location_id", ASCENDING),
+                ("meta.parameter", ASCENDING),
+                ("datetime", ASCENDING),
+            ],
+            {},
+        ),
+        (
+            TIMESERIES_COLLECTION,
+            [
+                ("meta.sensor_id", ASCENDING),
+                ("meta.parameter", ASCENDING),
+                ("datetime", ASCENDING),
+            ],
+            {},
+        ),
+    ]
+    + ROLLUP_INDEXES
+    + MARKER_INDEXES,
+}
+
+# Representative (collection, filter, sort) for each query the loaders and the
+# dashboard issue. Full-collection reads (map markers, location dropdown) are
+# scans by design and are left out.
+_DAY = "2024-01-01"
+_TIME = datetime(2024, 1, 1)
+ROLLUP_QUERIES = [
+    # db_helpers: rollup reads by location
+    (DAILY_COLLECTION, {"location_id": 0, "parameter": ""}, None),
+    (PERIOD_COLLECTION, {"location_id": 0, "parameter": "", "period": "W"}, None),
+    (PROFILE_COLLECTION, {"location_id": 0, "parameter": ""}, None),
+    # marker_store: per-location marker updates
+    (MARKERS_COLLECTION, {"location_id": 0}, None),
+    # rollup_store: daily upserts and the $merge regrouping ranges
+    (DAILY_COLLECTION, {"sensor_id": 0, "parameter": "", "date": _DAY}, None),
+    (
+        DAILY_COLLECTION,
+        {"sensor_id": {"$in": [0]}, "parameter": {"$in": [""]}, "date": {"$gte": _DAY}},
+        None,
+    ),
+]
+CHECKED_QUERIES = {
+    "nested": [
+        # nested_store: location upsert, sensor $push, measurement $pull and $push
+        (COLLECTION_NAME, {"location_id": 0}, None),
+        (COLLECTION_NAME, {"location_id": 0, "sensors.sensor_id": {"$ne": 0}}, None),
+        (COLLECTION_NAME, {"location_id": 0, "sensors.sensor_id": 0}, None),
+        # db_helpers: parameters and records by location name
+        (COLLECTION_NAME, {"location_name": ""}, None),
+    ],
+    "bucketed": [
+        (LOCATIONS_COLLECTION, {"location_id": 0}, None),
+        (LOCATIONS_COLLECTION, {"location_name": ""}, None),
+        (BUCKETS_COLLECTION, {"sensor_id": 0, "parameter": "", "date": _DAY}, None),
+        (
+            BUCKETS_COLLECTION,
+            {"sensor_id": 0, "parameter": "", "date": {"$in": [_DAY]}},
+            None,
+        ),
+        (BUCKETS_COLLECTION, {"location_id": 0, "parameter": ""}, None),
+    ],
+    "timeseries": [
+        (LOCATIONS_COLLECTION, {"location_id": 0}, None),
+        (LOCATIONS_COLLECTION, {"location_name": ""}, None),
+        (
+            TIMESERIES_COLLECTION,
+            {"meta.location_id": 0, "meta.parameter": ""},
+            [("datetime", ASCENDING)],
+        ),
+        (
+            TIMESERIES_COLLECTION,
+            # timeseries_store: exact-key deletes before each insert
+            {"meta.sensor_id": 0, "meta.parameter": "", "datetime": {"$in": [_TIME]}},
+            None,
+        ),
+    ],
+}
+
+
+def prepare_unique_location_index(db):
+    """One-time migration before the unique location_id index on us_air_data.
+
+    Collections filled by append loads can hold a location more than once, and
+    an older non-unique location_id index would clash with the unique one, so
+    duplicates are merged and that index dropped. A no-op once the unique
+    index exists.
+    """
+    collection = db[COLLECTION_NAME]
+    for name, info in collection.index_information().items():
+        if list(info["key"]) == [("location_id", ASCENDING)]:
+            if info.get("unique"):
+                return
+            collection.drop_index(name)
+    merged = dedupe_locations(db)
+    if merged:
+        print(f"✔ Merged {merged} locations stored more than once")
+
+
+def ensure_indexes(db, layout=STORAGE_LAYOUT):
+    """Create any missing indexes for `layout` (no-op for existing ones).
+
+    create_index on a missing collection creates a regular one, so the
+    time-series collection is created first.
+    """
+    if layout == "timeseries":
+        ensure_timeseries_collection(db)
+    if layout == "nested":
+        prepare_unique_location_index(db)
+    created = []
+    for collection_name, keys, options in INDEXES[layout]:
+        created.append(db[collection_name].create_index(keys, **options))
+    return created
+
+
+def missing_indexes(db, layout=STORAGE_LAYOUT):
+    """(collection, keys) pairs from INDEXES that do not exist yet."""
+    missing = []
+    for collection_name, keys, _ in INDEXES[layout]:
+        existing = [
+            list(info["key"])
+            for info in db[collection_name].index_information().values()
+        ]
+        if keys not in existing:
+            missing.append((collection_name, keys))
+    return missing
+
+
+def _winning_stages(explain):
+    # Winning plans are nested differently for plain finds, time-series
+    # aggregations and sharded clusters, so search the whole explain output
+    stack = [explain]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            for key, value in node.items():
+                if key in ("rejectedPlans", "allPlansExecution"):
+                    continue
+                if key == "stage":
+                    yield value
+                stack.append(value)
+
+
+def collscan_queries(db, layout=STORAGE_LAYOUT):
+    """Checked queries whose winning plan contains a COLLSCAN."""
+    failures = []
+    for collection_name, query, sort in CHECKED_QUERIES[layout] + ROLLUP_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if "COLLSCAN" in set(_winning_stages(cursor.explain())):
+            failures.append((collection_name, query))
+    return failures
+
+
+def check_indexes(db, layout=STORAGE_LAYOUT):
+    """Print missing indexes and collection scans; True when there are none."""
+    ok = True
+    for collection_name, keys in missing_indexes(db, layout):
+        print(f"✘ Missing index on '{collection_name}': {keys}")
+        ok = False
+    for collection_name, query in collscan_queries(db, layout):
+        print(f"✘ COLLSCAN on '{collection_name}' for {query}")
+        ok = False
+    if ok:
+        print(f"✔ All {layout} queries use an index.")
+    return ok
+
+
+if __name__ == "__main__":
+    command = sys.argv[1:] or ["ensure"]
+    if command not in (["ensure"], ["check"]):
+        print("Usage: python -m etl.mongo_indexes [ensure|check]")
+        sys.exit(1)
+
+    db = MongoClient(MONGO_URI)[DB_NAME]
+    if command == ["ensure"]:
+        for name in ensure_indexes(db):
+            print(f"✔ Index ready: {name}")
+    elif not check_indexes(db):
+        sys.exit(1)
@@ -0,0 +1,153 @@
+import os
+from collections import defaultdict
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+# Nested storage layout: one us_air_data document per location, with
+# sensors[].measurements[] arrays
+load_dotenv()
+NESTED_COLLECTION = "us_air_data"
+BULK_BATCH_SIZE = int(os.getenv("MONGO_BULK_BATCH_SIZE", "1000"))
+METADATA_FIELDS = ["location_name", "country", "locality", "coordinates"]
+
+
+def hours_by_date(measurements):
+    """{date: [hours]} for the measurements, to $pull them before re-pushing."""
+    hours = defaultdict(list)
+    for m in measurements:
+        hours[m["date"]].append(m["hour"])
+    return hours
+
+
+def build_nested_operations(structured):
+    """Upsert operations for the nested us_air_data layout, in four phases.
+
+    Each phase must finish before the next (a sensor can only be pushed into
+    an existing location, measurements need the sensor subdocument for the
+    positional update, and an hour is pulled before its new reading is
+    pushed); operations within a phase are independent. Metadata is
+    overwritten with $set, and each hour in the batch replaces the stored
+    reading for that hour, so revised values never leave a second entry and
+    measurements outside the batch (e.g. from realtime loads) are kept.
+    """
+    location_ops, sensor_ops, pull_ops, push_ops = [], [], [], []
+    for loc in structured:
+        loc_id = loc["location_id"]
+        if not loc["sensors"]:
+            continue
+
+        location_ops.append(
+            UpdateOne(
+                {"location_id": loc_id},
+                {
+                    "$set": {field: loc.get(field) for field in METADATA_FIELDS},
+                    "$setOnInsert": {"sensors": []},
+                },
+                upsert=True,
+            )
+        )
+        for sensor in loc["sensors"]:
+            sid = sensor["sensor_id"]
+            sensor_filter = {"location_id": loc_id, "sensors.sensor_id": sid}
+            sensor_ops.append(
+                UpdateOne(
+                    {"location_id": loc_id, "sensors.sensor_id": {"$ne": sid}},
+                    {
+                        "$push": {
+                            "sensors": {
+                                "sensor_id": sid,
+                                "parameter": sensor["parameter"],
+                                "units": sensor["units"],
+                                "measurements": [],
+                            }
+                        }
+                    },
+                )
+            )
+            if not sensor["measurements"]:
+                continue
+            replaced = [
+                {"date": date, "hour": {"$in": hours}}
+                for date, hours in hours_by_date(sensor["measurements"]).items()
+            ]
+            pull_ops.append(
+                UpdateOne(
+                    sensor_filter,
+                    {"$pull": {"sensors.$.measurements": {"$or": replaced}}},
+                )
+            )
+            push_ops.append(
+                UpdateOne(
+                    sensor_filter,
+                    {
+                        "$set": {"sensors.$.units": sensor["units"]},
+                        "$push": {
+                            "sensors.$.measurements": {"$each": sensor["measurements"]}
+                        },
+                    },
+                )
+            )
+    return [location_ops, sensor_ops, pull_ops, push_ops]
+
+
+def load_structured_nested(db, structured, batch_size=BULK_BATCH_SIZE):
+    """Upsert nested-shaped location documents, merging their measurements."""
+    collection = db[NESTED_COLLECTION]
+    for operations in build_nested_operations(structured):
+        for i in range(0, len(operations), batch_size):
+            collection.bulk_write(operations[i : i + batch_size], ordered=False)
+
+
+# -----------------------------
+# Duplicate locations
+# -----------------------------
+
+
+def merge_location_documents(docs):
+    """One nested document from several stored for the same location.
+
+    `docs` are in insertion order; later documents win for metadata, sensor
+    units and any hour stored more than once.
+    """
+    merged = {
+        key: value
+        for key, value in docs[-1].items()
+        if key not in ("_id", "sensors", "content_hash")
+    }
+    sensors = {}
+    for doc in docs:
+        for sensor in doc.get("sensors", []):
+            entry = sensors.setdefault(sensor["sensor_id"], {"measurements": {}})
+            entry.update({k: v for k, v in sensor.items() if k != "measurements"})
+            for m in sensor.get("measurements", []):
+                entry["measurements"][(m["date"], m["hour"])] = m
+    merged["sensors"] = [
+        {**sensor, "measurements": [m for _, m in sorted(sensor["measurements"].items())]}
+        for sensor in sensors.values()
+    ]
+    return merged
+
+
+def dedupe_locations(db):
+    """Merge locations stored more than once (by append loads) into one document.
+
+    The merged document replaces the oldest copy before the others are
+    deleted, so an interrupted run loses nothing and can simply be repeated.
+    Returns the number of locations merged.
+    """
+    collection = db[NESTED_COLLECTION]
+    duplicates = collection.aggregate(
+        [
+            {"$group": {"_id": "$location_id", "ids": {"$push": "$_id"}}},
+            {"$match": {"ids.1": {"$exists": True}}},
+        ],
+        allowDiskUse=True,
+    )
+    merged = 0
+    for group in duplicates:
+        docs = list(collection.find({"_id": {"$in": group["ids"]}}).sort("_id", 1))
+        keep, extra = docs[0]["_id"], [doc["_id"] for doc in docs[1:]]
+        collection.replace_one({"_id": keep}, merge_location_documents(docs))
+        collection.delete_many({"_id": {"$in": extra}})
+        merged += 1
+    return merged
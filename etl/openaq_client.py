@@ -0,0 +1,225 @@
+import os
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+
+# Client config
+load_dotenv()
+BASE_URL = os.getenv("OPENAQ_BASE_URL", "https://api.openaq.org/v3")
+POOL_SIZE = int(os.getenv("OPENAQ_POOL_SIZE", "16"))
+
+# Rate limit config (per API key)
+RATE_LIMIT_PER_MINUTE = float(os.getenv("OPENAQ_RATE_LIMIT_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = int(os.getenv("OPENAQ_RATE_LIMIT_BURST", "10"))
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 10  # First backoff when the server gives no hint
+REQUEST_TIMEOUT = 30
+
+# -----------------------------
+# Token Bucket
+# -----------------------------
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every caller using one API key.
+
+    The refill rate starts at the configured quota and is re-tuned from the
+    server's X-RateLimit-* headers; a 429 pauses the whole bucket so all
+    callers back off together instead of each one sleeping on its own.
+    """
+
+    def __init__(
+        self, rate_per_minute=RATE_LIMIT_PER_MINUTE, capacity=RATE_LIMIT_BURST
+    ):
+        self.base_rate = rate_per_minute / 60.0
+        self.rate = self.base_rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds`."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+    def update_from_headers(self, headers):
+        """Pace the rest of the server's rate-limit window evenly."""
+        remaining = _header_float(headers, "X-RateLimit-Remaining")
+        reset = _header_float(headers, "X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        if reset > 1e9:  # Epoch timestamp rather than seconds-until-reset
+            reset -= time.time()
+        reset = max(reset, 1.0)
+
+        with self.lock:
+            self._refill(time.monotonic())
+            if remaining < 1:
+                self.paused_until = max(self.paused_until, time.monotonic() + reset)
+                self.tokens = 0.0
+            else:
+                self.rate = max(remaining / reset, self.base_rate / 10)
+                self.tokens = min(self.tokens, remaining)
+
+
+def _header_float(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_seconds(response):
+    """Seconds requested by a Retry-After header (delta or HTTP date), if any."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_status(status):
+    """429 and 5xx may succeed later; any other error status is permanent."""
+    return status == 429 or 500 <= status < 600
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key):
+    """Return the process-wide bucket for `api_key`."""
+    with _buckets_lock:
+        if api_key not in _buckets:
+            _buckets[api_key] = TokenBucket()
+        return _buckets[api_key]
+
+
+# -----------------------------
+# Pooled Client
+# -----------------------------
+
+
+class OpenAQClient:
+    """Keep-alive, gzip-enabled OpenAQ client shared by all extract modules.
+
+    Every request goes through one pooled session and the API key's shared
+    token bucket. 429 and 5xx responses are retried, honouring Retry-After
+    when present and doubling the wait otherwise.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        base_url=BASE_URL,
+        pool_size=POOL_SIZE,
+        timeout=REQUEST_TIMEOUT,
+        max_retries=MAX_RETRIES,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pool_size = 0
+        self.limiter = get_rate_limiter(api_key)
+
+        self.session = requests.Session()
+        self.session.headers.update(
+            {
+                "X-API-Key": api_key,
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip, deflate",
+            }
+        )
+        self.ensure_pool_size(pool_size)
+
+    def ensure_pool_size(self, pool_size):
+        """Grow the connection pool to at least `pool_size` connections."""
+        if pool_size <= self.pool_size:
+            return
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.pool_size = pool_size
+
+    def get(self, path, params=None, timeout=None):
+        """GET `path` (relative to the base URL) and return the final response.
+
+        Network errors propagate to the caller.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        backoff = BACKOFF_SECONDS
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            response = self.session.get(
+                url, params=params, timeout=timeout or self.timeout
+            )
+            self.limiter.update_from_headers(response.headers)
+
+            status = response.status_code
+            if not is_retryable_status(status):
+                return response
+            if attempt == self.max_retries:
+                break
+
+            wait = retry_after_seconds(response)
+            if wait is None:
+                wait = backoff
+                backoff *= 2
+            logging.warning(f"HTTP {status} from {url} — retrying in {wait:.0f}s")
+            if status == 429:
+                self.limiter.pause(wait)
+            else:
+                time.sleep(wait)
+
+        logging.warning(f"Max retries exceeded for {url}")
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key, pool_size=POOL_SIZE):
+    """Return the process-wide client for `api_key`, creating it on first use.
+
+    The pool is sized for the largest `pool_size` any caller has asked for.
+    """
+    with _clients_lock:
+        if api_key not in _clients:
+            _clients[api_key] = OpenAQClient(api_key, pool_size=pool_size)
+        else:
+            _clients[api_key].ensure_pool_size(pool_size)
+        return _clients[api_key]
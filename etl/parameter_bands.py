@@ -1,3 +1,5 @@
+# Safety bands per parameter: (low, high, colour, label). Shared by the marker
+# categories written at load time and the dashboard's plots and summary card
 PARAMETER_BANDS = {
     "pm25": [
         (0.0, 12.0, "#d2f8d2", "Good"),
@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import uuid
+import pandas as pd
+from dotenv import load_dotenv
+
+# Raw per-sensor measurement store shared by the extractor and the transform
+load_dotenv()
+RAW_STORE_FORMAT = os.getenv("RAW_STORE_FORMAT", "jsonl")  # "jsonl" or "parquet"
+JSONL_DIR = "data/data_by_sensor"
+PARQUET_DIR = "data/raw_parquet"
+RAW_COLUMNS = ["datetime", "parameter", "value"]
+
+
+# ---- Writing ----
+
+
+def write_sensor_batch(sensor_id, entries, fmt=RAW_STORE_FORMAT):
+    """Append one batch of {datetime, parameter, value} entries for a sensor."""
+    if not entries:
+        return
+    if fmt == "parquet":
+        _write_parquet(sensor_id, entries)
+    else:
+        _write_jsonl(sensor_id, entries)
+
+
+def _write_jsonl(sensor_id, entries):
+    sensor_path = os.path.join(JSONL_DIR, f"sensor_{sensor_id}")
+    os.makedirs(sensor_path, exist_ok=True)
+    out_file = os.path.join(sensor_path, f"sensor_{sensor_id}.jsonl")
+    with open(out_file, "a", encoding="utf-8") as f_out:
+        for v in entries:
+            f_out.write(json.dumps(v) + "\n")
+
+
+def _write_parquet(sensor_id, entries):
+    # One file per batch under a sensor_id=<id> partition, merged afterwards by
+    # compact_parquet(). Columns are typed up front so every part file of a
+    # sensor shares one schema.
+    df = pd.DataFrame(entries, columns=RAW_COLUMNS)
+    df["datetime"] = pd.to_datetime(df["datetime"], utc=True)
+    df["value"] = df["value"].astype("float64")
+
+    partition = os.path.join(PARQUET_DIR, f"sensor_id={sensor_id}")
+    os.makedirs(partition, exist_ok=True)
+    df.to_parquet(
+        os.path.join(partition, f"part-{uuid.uuid4().hex}.parquet"), index=False
+    )
+
+
+def compact_parquet(sensor_ids=None):
+    """Merge each sensor's part files into one, sorted by datetime.
+
+    Extraction writes one small part per fetched chunk, so a full backfill
+    leaves many tiny files per sensor. The merged file is written under a
+    hidden name (which readers skip) and renamed into place before the old
+    parts are removed; a crash in between only leaves duplicate rows, which
+    the transform drops. Returns the number of part files merged away.
+    """
+    if not os.path.isdir(PARQUET_DIR):
+        return 0
+    if sensor_ids is None:
+        partitions = [
+            os.path.join(PARQUET_DIR, name)
+            for name in os.listdir(PARQUET_DIR)
+            if name.startswith("sensor_id=")
+        ]
+    else:
+        partitions = [
+            os.path.join(PARQUET_DIR, f"sensor_id={sensor_id}")
+            for sensor_id in sensor_ids
+        ]
+
+    removed = 0
+    for partition in partitions:
+        if not os.path.isdir(partition):
+            continue
+        parts = [
+            os.path.join(partition, name)
+            for name in os.listdir(partition)
+            if name.startswith("part-") and name.endswith(".parquet")
+        ]
+        if len(parts) < 2:
+            continue
+        df = pd.concat((pd.read_parquet(part) for part in parts), ignore_index=True)
+        df = df.sort_values("datetime", kind="stable")
+
+        name = f"part-{uuid.uuid4().hex}.parquet"
+        tmp_path = os.path.join(partition, f".{name}.tmp")
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(partition, name))
+        for part in parts:
+            os.remove(part)
+        removed += len(parts) - 1
+    return removed
+
+
+# ---- Reading ----
+
+
+def read_sensor_frame(sensor_ids, fmt=RAW_STORE_FORMAT, columns=RAW_COLUMNS):
+    """Raw measurements for `sensor_ids` as one DataFrame with a sensor_id column."""
+    if fmt == "parquet":
+        frames = []
+        for sensor_id in sensor_ids:
+            partition = os.path.join(PARQUET_DIR, f"sensor_id={sensor_id}")
+            if not os.path.isdir(partition):
+                continue
+            df = pd.read_parquet(partition, columns=columns)
+            if "datetime" in df.columns:
+                # Part files are batches in fetch order; return them in time order
+                df = df.sort_values("datetime", kind="stable")
+            df["sensor_id"] = sensor_id
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=columns + ["sensor_id"])
+        return pd.concat(frames, ignore_index=True)
+
+    return pd.DataFrame(_read_jsonl(sensor_ids))
+
+
+def _read_jsonl(sensor_ids):
+    all_data = []
+    for sensor_id in sensor_ids:
+        folder_path = os.path.join(JSONL_DIR, f"sensor_{sensor_id}")
+        if not os.path.isdir(folder_path):
+            continue
+        for filename in os.listdir(folder_path):
+            if filename.endswith(".jsonl") and filename.startswith("sensor_"):
+                file_path = os.path.join(folder_path, filename)
+                with open(file_path, "r") as f:
+                    for line in f:
+                        record = json.loads(line)
+                        record["sensor_id"] = sensor_id
+                        all_data.append(record)
+    return all_data
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["compact"]:
+        print("Usage: python -m etl.raw_store compact")
+        sys.exit(1)
+    print(f"✔ Compacted away {compact_parquet()} Parquet part files.")
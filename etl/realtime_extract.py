@@ -1,56 +1,123 @@
-import os, json, time, logging, requests
-from datetime import datetime, timedelta, timezone
+import os, json, gzip, logging, requests
+from datetime import datetime, timezone
 from dotenv import load_dotenv
+from etl.openaq_client import get_client
+from etl.extract_locations import fetch_latest_by_sensor, active_sensor_ids
+from etl.extract_sensor_units import build_sensor_lookup, extract_active_sensor_info
+from etl.realtime_watermarks import (
+    load_watermarks,
+    fetch_window_start,
+    save_pending_watermarks,
+    parse_utc,
+)
 
 load_dotenv()
 API_KEY = os.getenv("OPENAQ_API_KEY_1")
-HEADERS = {"X-API-Key": f"{API_KEY}"}
-BASE_URL = "https://api.openaq.org/v3/sensors/{}/measurements"
+MEASUREMENTS_PATH = "/sensors/{}/measurements"
+CLIENT = get_client(API_KEY)
 
 SENSOR_FILE = "data/active_locations_filtered.jsonl"
-EXTRACTED_FILE = "data/realtime_raw.json"
+LOCATION_FILE = "data/US_with_sensors.json"
+SENSOR_UNITS_FILE = "data/active_sensor_info.jsonl"
+# Append-only NDJSON buffer of records not yet loaded (gzip if it ends in .gz)
+EXTRACTED_FILE = os.getenv("REALTIME_RAW_FILE", "data/realtime_raw.jsonl.gz")
+WATERMARK_FLUSH_SENSORS = 50  # Stage watermarks this often
+
+
+def open_extracted(mode="at"):
+    if EXTRACTED_FILE.endswith(".gz"):
+        return gzip.open(EXTRACTED_FILE, mode, encoding="utf-8")
+    return open(EXTRACTED_FILE, mode, encoding="utf-8")
+
+
+def refresh_active_sensors(active_locations, watermarks):
+    """Probe /locations/{id}/latest once per location before fetching.
+
+    Updates each location's active sensor list (rewriting SENSOR_FILE and the
+    units file if anything changed) and returns {location_id: [sensor IDs]}
+    holding only sensors whose latest reading is newer than their watermark.
+    """
+    due = {}
+    changed = False
+
+    for loc in active_locations:
+        try:
+            latest = fetch_latest_by_sensor(loc["id"])
+        except Exception as e:
+            logging.warning(f"Probe for location {loc['id']} failed: {e}")
+            latest = None
+        if latest is None:
+            # Probe failed: fall back to fetching the known sensors
+            due[loc["id"]] = loc["active_sensor_ids"]
+            continue
+
+        active_ids = active_sensor_ids(latest)
+        if active_ids != loc["active_sensor_ids"]:
+            logging.info(
+                f"Location {loc['id']} active sensors: "
+                f"{loc['active_sensor_ids']} -> {active_ids}"
+            )
+            loc["active_sensor_ids"] = active_ids
+            changed = True
+
+        # /latest reports the end of the newest period while watermarks hold its
+        # start, so this errs on the side of fetching
+        due[loc["id"]] = [
+            sid
+            for sid in active_ids
+            if sid not in watermarks
+            or parse_utc(latest[sid]) > parse_utc(watermarks[sid])
+        ]
+
+    if changed:
+        tmp_file = f"{SENSOR_FILE}.tmp"
+        with open(tmp_file, "w") as f:
+            for loc in active_locations:
+                f.write(json.dumps(loc) + "\n")
+        os.replace(tmp_file, SENSOR_FILE)
+        if os.path.exists(LOCATION_FILE):
+            extract_active_sensor_info(
+                SENSOR_FILE, build_sensor_lookup(LOCATION_FILE), SENSOR_UNITS_FILE
+            )
+
+    return due
 
 
 def extract_realtime_data():
-    today = datetime.now(timezone.utc).date()
-    tomorrow = today + timedelta(days=1)
-    all_data = []
+    now = datetime.now(timezone.utc)
+    # Records from an earlier failed run are still in the buffer, so resume
+    # from their staged watermarks rather than fetching them again
+    watermarks = load_watermarks(include_pending=True)
+    new_watermarks = dict(watermarks)
+    extracted = 0
+    fetched_sensors = 0
 
     with open(SENSOR_FILE) as f:
         active_locations = [json.loads(line) for line in f]
 
+    due = refresh_active_sensors(active_locations, watermarks)
+    skipped = sum(len(loc["active_sensor_ids"]) for loc in active_locations) - sum(
+        len(sids) for sids in due.values()
+    )
+    logging.info(f"Skipping {skipped} sensors with no new readings")
+
     for loc in active_locations:
-        for sid in loc["active_sensor_ids"]:
+        for sid in due[loc["id"]]:
             try:
-                url = BASE_URL.format(sid)
+                path = MEASUREMENTS_PATH.format(sid)
+                since = fetch_window_start(watermarks.get(sid), now)
                 params = {
-                    "datetime_from": today.isoformat(),
-                    "datetime_to": tomorrow.isoformat(),
+                    "datetime_from": since.isoformat(),
+                    "datetime_to": now.isoformat(),
                     "limit": 100,
                     "page": 1,
                 }
-
-                retry_delay = 10
-                attempt = 0
-                max_retries = 5
+                sensor_data = []
+                complete = False
 
                 while True:
                     try:
-                        r = requests.get(
-                            url, headers=HEADERS, params=params, timeout=10
-                        )
-
-                        if r.status_code == 429:
-                            if attempt < max_retries:
-                                logging.warning(
-                                    f"429 Too Many Requests for sensor {sid} — retrying in {retry_delay}s"
-                                )
-                                time.sleep(retry_delay)
-                                retry_delay *= 2
-                                attempt += 1
-                                continue
-                            else:
-                                break
+                        r = CLIENT.get(path, params=params, timeout=10)
 
                         if r.status_code != 200:
                             logging.warning(f"Sensor {sid} failed: {r.status_code}")
@@ -58,30 +125,49 @@ def extract_realtime_data():
 
                         results = r.json().get("results", [])
                         if not results:
+                            complete = True
                             break
 
                         for entry in results:
-                            all_data.append(
+                            dt = entry["period"]["datetimeFrom"]["utc"]
+                            # datetime_from is inclusive; skip what we already have
+                            if sid in watermarks and parse_utc(dt) <= since:
+                                continue
+                            sensor_data.append(
                                 {
                                     "sensor_id": sid,
-                                    "datetime": entry["period"]["datetimeFrom"]["utc"],
+                                    "datetime": dt,
                                     "parameter": entry["parameter"]["name"],
                                     "value": entry["value"],
                                 }
                             )
 
                         if len(results) < params["limit"]:
+                            complete = True
                             break
                         else:
                             params["page"] += 1
-
-                        time.sleep(1)
                     except requests.exceptions.Timeout:
                         logging.error(f"Timeout for sensor {sid}")
                         break
+
+                if sensor_data:
+                    # One append (one gzip member) per sensor keeps every
+                    # finished sensor readable even if the run dies later
+                    with open_extracted() as out:
+                        out.writelines(json.dumps(m) + "\n" for m in sensor_data)
+                    extracted += len(sensor_data)
+                # Only move the watermark once the sensor's window was fully read
+                if complete and sensor_data:
+                    new_watermarks[sid] = max(
+                        (m["datetime"] for m in sensor_data), key=parse_utc
+                    )
             except Exception as e:
                 logging.error(f"Unhandled error for sensor {sid}: {str(e)}")
 
-    with open(EXTRACTED_FILE, "w") as f:
-        json.dump(all_data, f)
-    logging.info(f"Extracted {len(all_data)} records to {EXTRACTED_FILE}")
+            fetched_sensors += 1
+            if fetched_sensors % WATERMARK_FLUSH_SENSORS == 0:
+                save_pending_watermarks(new_watermarks)
+
+    save_pending_watermarks(new_watermarks)
+    logging.info(f"Extracted {extracted} records to {EXTRACTED_FILE}")
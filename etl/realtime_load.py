@@ -1,29 +1,56 @@
-import json, os, logging
+import os, logging, ijson
 from pymongo import MongoClient
 from dotenv import load_dotenv
+from etl.realtime_watermarks import commit_watermarks
+from etl.nested_store import load_structured_nested
+from etl.bucket_store import load_structured_buckets
+from etl.timeseries_store import load_structured_timeseries
+from etl.mongo_indexes import ensure_indexes
+from etl.rollup_store import update_rollups
+from etl.marker_store import refresh_markers
+from etl.etl_state import mark_data_loaded
 
 load_dotenv()
+EXTRACTED_FILE = os.getenv("REALTIME_RAW_FILE", "data/realtime_raw.jsonl.gz")
 TRANSFORMED_FILE = "data/realtime_transformed.json"
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://host.docker.internal:27017/")
 DB_NAME = "air_quality"
-COLLECTION_NAME = "us_air_data"
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "nested")  # nested|bucketed|timeseries
+BULK_BATCH_SIZE = int(os.getenv("MONGO_BULK_BATCH_SIZE", "1000"))
+LOAD_BATCH_LOCATIONS = 200  # Transformed documents held in memory at once
 
 
-def load_realtime_data():
+def iter_transformed(batch_locations=LOAD_BATCH_LOCATIONS):
+    """Stream the transformed file in batches of location documents."""
+    batch = []
+    with open(TRANSFORMED_FILE, "rb") as f:
+        for record in ijson.items(f, "item", use_float=True):
+            batch.append(record)
+            if len(batch) >= batch_locations:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def load_realtime_data(batch_size=BULK_BATCH_SIZE):
     client = MongoClient(MONGO_URI)
-    collection = client[DB_NAME][COLLECTION_NAME]
 
-    with open(TRANSFORMED_FILE) as f:
-        structured = json.load(f)
+    ensure_indexes(client[DB_NAME], STORAGE_LAYOUT)
 
-    for loc in structured:
-        loc_id = loc["location_id"]
-        for sensor in loc["sensors"]:
-            sid = sensor["sensor_id"]
-            for m in sensor["measurements"]:
-                collection.update_one(
-                    {"location_id": loc_id, "sensors.sensor_id": sid},
-                    {"$addToSet": {"sensors.$.measurements": m}},
-                )
+    for structured in iter_transformed():
+        if STORAGE_LAYOUT == "bucketed":
+            load_structured_buckets(client[DB_NAME], structured, batch_size)
+        elif STORAGE_LAYOUT == "timeseries":
+            load_structured_timeseries(client[DB_NAME], structured, batch_size)
+        else:
+            load_structured_nested(client[DB_NAME], structured, batch_size)
+        update_rollups(client[DB_NAME], structured, batch_size)
+        refresh_markers(client[DB_NAME], structured, batch_size)
+    mark_data_loaded(client[DB_NAME], "realtime")
 
+    # The raw buffer is only emptied once its records are in MongoDB
+    commit_watermarks()
+    if os.path.exists(EXTRACTED_FILE):
+        os.remove(EXTRACTED_FILE)
     logging.info("MongoDB updated with transformed real-time data.")
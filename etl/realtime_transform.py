@@ -1,88 +1,145 @@
-import json, os, pandas as pd, numpy as np
-from datetime import datetime
+import json, os, pandas as pd
 from dotenv import load_dotenv
 
 load_dotenv()
 
 SENSOR_FILE = "data/active_locations_filtered.jsonl"
 SENSOR_UNITS_FILE = "data/active_sensor_info.jsonl"
-EXTRACTED_FILE = "data/realtime_raw.json"
+EXTRACTED_FILE = os.getenv("REALTIME_RAW_FILE", "data/realtime_raw.jsonl.gz")
 TRANSFORMED_FILE = "data/realtime_transformed.json"
+READ_CHUNK_ROWS = 50000
+RAW_COLUMNS = ["sensor_id", "datetime", "parameter", "value"]
+SENSOR_TABLE_CACHE = "data/realtime_sensor_table.pkl"
+LOCATION_COLUMNS = [
+    "location_id", "location_name", "country", "locality", "coordinates"
+]
+SENSOR_COLUMNS = ["sensor_id", "parameter", "units", "measurements"]
 
-def transform_realtime_data():
-    with open(EXTRACTED_FILE) as f:
-        raw = json.load(f)
 
-    df = pd.DataFrame(raw)
-    df.dropna(subset=["datetime", "parameter", "value"], inplace=True)
-    df.drop_duplicates(subset=["sensor_id", "datetime", "parameter"], inplace=True)
-    df["datetime"] = pd.to_datetime(df["datetime"], utc=True)
-    df["date"] = df["datetime"].dt.date
-    df["hour"] = df["datetime"].dt.hour
+def iter_extracted():
+    """Yield the NDJSON buffer in cleaned chunks of at most READ_CHUNK_ROWS."""
+    if not os.path.exists(EXTRACTED_FILE):
+        return
+    reader = pd.read_json(
+        EXTRACTED_FILE, lines=True, chunksize=READ_CHUNK_ROWS, convert_dates=False
+    )
+    for chunk in reader:
+        chunk = chunk.reindex(columns=RAW_COLUMNS)
+        chunk.dropna(subset=["datetime", "parameter", "value"], inplace=True)
+        chunk.drop_duplicates(
+            subset=["sensor_id", "datetime", "parameter"], inplace=True
+        )
+        yield chunk
 
-    location_map = {}
-    location_lookup = {}
+def load_sensor_table():
+    """Location rows, sensor→location map and (sensor, parameter)→units table.
 
+    Built once and pickled to SENSOR_TABLE_CACHE; later runs reuse it until
+    the active-sensor or units file changes.
+    """
+    source_mtime = max(
+        os.path.getmtime(SENSOR_FILE), os.path.getmtime(SENSOR_UNITS_FILE)
+    )
+    if (
+        os.path.exists(SENSOR_TABLE_CACHE)
+        and os.path.getmtime(SENSOR_TABLE_CACHE) >= source_mtime
+    ):
+        return pd.read_pickle(SENSOR_TABLE_CACHE)
+
+    locations = []
+    sensor_locations = []
     with open(SENSOR_FILE) as f:
         for line in f:
             loc = json.loads(line)
-            location_entry = {
+            locations.append({
                 "location_id": loc["id"],
                 "location_name": loc["name"],
                 "country": loc["country"],
                 "locality": loc.get("locality"),
                 "coordinates": loc.get("coordinates"),
-                "sensors": []
-            }
-            location_lookup[loc["id"]] = location_entry
+            })
             for sensor_id in loc["active_sensor_ids"]:
-                location_map[sensor_id] = loc["id"]
+                sensor_locations.append(
+                    {"sensor_id": sensor_id, "location_id": loc["id"]}
+                )
 
-    sensor_units_map = {}
     with open(SENSOR_UNITS_FILE) as f:
-        for line in f:
-            entry = json.loads(line)
-            sensor_units_map[(entry["sensor_id"], entry["parameter"])] = entry["units"]
-
-    grouped = df.groupby(["sensor_id", "parameter"])
-    sensor_data_grouped = {}
-
-    for (sensor_id, parameter), group in grouped:
-        location_id = location_map.get(sensor_id)
-        if location_id is None:
-            continue
-        key = (location_id, sensor_id, parameter)
-        if key not in sensor_data_grouped:
-            sensor_data_grouped[key] = []
-        for _, row in group.iterrows():
-            sensor_data_grouped[key].append({
-                "date": row["date"].isoformat(),
-                "hour": int(row["hour"]),
-                "value": row["value"]
-            })
+        units = pd.DataFrame([json.loads(line) for line in f])
+
+    locations = pd.DataFrame(locations, columns=LOCATION_COLUMNS).astype(object)
+    tables = (
+        locations.where(locations.notna(), None),  # Missing fields stay JSON null
+        pd.DataFrame(sensor_locations, columns=["sensor_id", "location_id"])
+        .drop_duplicates("sensor_id", keep="last"),
+        units.reindex(columns=["sensor_id", "parameter", "units"])
+        .drop_duplicates(["sensor_id", "parameter"], keep="last"),
+    )
+    pd.to_pickle(tables, SENSOR_TABLE_CACHE)
+    return tables
+
+def nest_chunk(df, sensor_locations, units):
+    """{location_id: [sensor documents]} for one cleaned chunk of the buffer."""
+    df = df.copy()
+    df["datetime"] = pd.to_datetime(df["datetime"], utc=True)
+    df["date"] = df["datetime"].dt.strftime("%Y-%m-%d")
+    df["hour"] = df["datetime"].dt.hour
+
+    # One join attaches location and units to every measurement
+    df = df.merge(sensor_locations, on="sensor_id", how="inner")
+    df = df.merge(units, on=["sensor_id", "parameter"], how="left")
+    df["units"] = df["units"].fillna("unknown")
+    if df.empty:
+        return {}
+
+    # Nest measurements per sensor, then sensors per location; pandas does the
+    # per-row work and to_dict yields JSON-native scalars
+    sensor_keys = ["location_id", "sensor_id", "parameter", "units"]
+    sensors = (
+        df.groupby(sensor_keys, sort=True)[["date", "hour", "value"]]
+        .apply(lambda g: g.to_dict("records"))
+        .rename("measurements")
+        .reset_index()
+        .sort_values(["location_id", "sensor_id", "parameter"], kind="stable")
+    )
+    return sensors.groupby("location_id")[SENSOR_COLUMNS].apply(
+        lambda g: g.to_dict("records")
+    ).to_dict()
+
+
+def transform_realtime_data():
+    """Write the buffer as nested location documents, one chunk at a time.
+
+    Each chunk is nested and written before the next is read, so memory is
+    bounded by READ_CHUNK_ROWS rather than the buffer size. A location whose
+    records span chunks appears once per chunk; every loader merges them.
+    Locations with no new records are written last with no sensors.
+    """
+    locations, sensor_locations, units = load_sensor_table()
+    location_rows = {
+        row["location_id"]: row for row in locations.to_dict("records")
+    }
+    written = set()
 
-    for (location_id, sensor_id, parameter), measurements in sensor_data_grouped.items():
-        units = sensor_units_map.get((sensor_id, parameter), "unknown")
-        location_lookup[location_id]["sensors"].append({
-            "sensor_id": sensor_id,
-            "parameter": parameter,
-            "units": units,
-            "measurements": measurements
-        })
-
-    def convert(obj):
-        if isinstance(obj, dict):
-            return {k: convert(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [convert(i) for i in obj]
-        elif isinstance(obj, (np.int64, np.int32)):
-            return int(obj)
-        elif isinstance(obj, (np.float64, np.float32)):
-            return float(obj)
-        elif isinstance(obj, (pd.Timestamp, datetime)):
-            return obj.isoformat()
-        return obj
-
-    output = convert(list(location_lookup.values()))
     with open(TRANSFORMED_FILE, "w") as f:
-        json.dump(output, f, indent=2)
+        f.write("[\n")
+        first = True
+
+        def write(location_id, sensors):
+            nonlocal first
+            if not first:
+                f.write(",\n")
+            first = False
+            json.dump({**location_rows[location_id], "sensors": sensors}, f)
+
+        for chunk in iter_extracted():
+            for location_id, sensors in nest_chunk(
+                chunk, sensor_locations, units
+            ).items():
+                write(location_id, sensors)
+                written.add(location_id)
+
+        for location_id in location_rows:
+            if location_id not in written:
+                write(location_id, [])
+
+        f.write("\n]")
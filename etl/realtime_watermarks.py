@@ -0,0 +1,62 @@
+import os, json
+from datetime import datetime, timedelta
+
+WATERMARK_FILE = "data/realtime_watermarks.json"
+PENDING_WATERMARK_FILE = "data/realtime_watermarks.pending.json"
+LOOKBACK_HOURS = 24  # Window fetched for sensors without a watermark yet
+
+
+def parse_utc(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {int(sid): ts for sid, ts in json.load(f).items()}
+
+
+def _write(path, marks):
+    # Write-then-rename so a crash never leaves a half-written watermark file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({str(sid): ts for sid, ts in marks.items()}, f)
+    os.replace(tmp_path, path)
+
+
+def load_watermarks(include_pending=False):
+    """Last loaded measurement timestamp (UTC ISO string) per sensor ID.
+
+    With `include_pending`, watermarks staged for extracted-but-unloaded data
+    take precedence.
+    """
+    marks = _read(WATERMARK_FILE)
+    if include_pending:
+        marks.update(_read(PENDING_WATERMARK_FILE))
+    return marks
+
+
+def fetch_window_start(watermark, now):
+    """Where to start fetching: the watermark itself, or the lookback window."""
+    if watermark:
+        return parse_utc(watermark)
+    return now - timedelta(hours=LOOKBACK_HOURS)
+
+
+def save_pending_watermarks(marks):
+    """Stage watermarks for data that has been extracted but not yet loaded."""
+    _write(PENDING_WATERMARK_FILE, marks)
+
+
+def commit_watermarks():
+    """Promote staged watermarks once their data is safely in MongoDB."""
+    pending = _read(PENDING_WATERMARK_FILE)
+    if not pending:
+        return
+    marks = load_watermarks()
+    for sid, ts in pending.items():
+        if sid not in marks or parse_utc(ts) > parse_utc(marks[sid]):
+            marks[sid] = ts
+    _write(WATERMARK_FILE, marks)
+    os.remove(PENDING_WATERMARK_FILE)
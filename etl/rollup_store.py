@@ -0,0 +1,295 @@
+import os
+import sys
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date, timedelta
+from pymongo import MongoClient, UpdateOne, UpdateMany
+from dotenv import load_dotenv
+from etl.layout_source import iter_structured_batches
+
+# Pre-aggregated rollups maintained by both load paths, so the dashboard reads
+# a bounded number of small documents instead of resampling the full history
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DB_NAME = "air_quality"
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "nested")  # nested|bucketed|timeseries
+DAILY_COLLECTION = "rollups_daily"  # Per sensor/day: hours map plus stats
+PERIOD_COLLECTION = "rollups_periods"  # Per sensor/week or month: stats
+PROFILE_COLLECTION = "rollups_hour_of_week"  # Per sensor/month: dow x hour sums
+BULK_BATCH_SIZE = int(os.getenv("MONGO_BULK_BATCH_SIZE", "1000"))
+
+# Period documents are dated like pandas resample labels: the Sunday ending
+# the week ("W") and the last day of the month ("M")
+PERIODS = {"W": "week", "M": "month"}
+
+# Recomputes a daily rollup's stats from its hours map
+DAILY_STATS_PIPELINE = [
+    {
+        "$set": {
+            "_values": {
+                "$map": {"input": {"$objectToArray": "$hours"}, "in": "$$this.v"}
+            }
+        }
+    },
+    {
+        "$set": {
+            "count": {"$size": "$_values"},
+            "sum": {"$sum": "$_values"},
+            "min": {"$min": "$_values"},
+            "max": {"$max": "$_values"},
+            "mean": {"$avg": "$_values"},
+        }
+    },
+    {"$unset": "_values"},
+]
+
+
+def _day(value):
+    return date.fromisoformat(value)
+
+
+def period_bounds(dates, period):
+    """First and last day of the W or M periods covering `dates`."""
+    first, last = _day(min(dates)), _day(max(dates))
+    if period == "W":
+        start = first - timedelta(days=first.weekday())
+        end = last + timedelta(days=6 - last.weekday())
+    else:
+        start = first.replace(day=1)
+        end = last.replace(day=monthrange(last.year, last.month)[1])
+    return start.isoformat(), end.isoformat()
+
+
+def build_daily_operations(structured):
+    """Daily rollup upserts, stats refreshes and the sensors/dates they touch.
+
+    Hours are set by key, so re-loading the same measurements leaves the
+    rollups unchanged.
+    """
+    hour_ops, stats_ops = [], []
+    touched = defaultdict(set)  # (sensor_id, parameter) -> dates
+    for loc in structured:
+        for sensor in loc.get("sensors", []):
+            by_date = defaultdict(dict)
+            for m in sensor.get("measurements", []):
+                by_date[m["date"]][f"hours.{m['hour']}"] = m["value"]
+            if not by_date:
+                continue
+
+            key = {"sensor_id": sensor["sensor_id"], "parameter": sensor["parameter"]}
+            for day, hours in by_date.items():
+                hour_ops.append(
+                    UpdateOne(
+                        {**key, "date": day},
+                        {
+                            "$set": {
+                                "location_id": loc["location_id"],
+                                "units": sensor.get("units", "unknown"),
+                                **hours,
+                            }
+                        },
+                        upsert=True,
+                    )
+                )
+            stats_ops.append(
+                UpdateMany(
+                    {**key, "date": {"$in": list(by_date)}}, DAILY_STATS_PIPELINE
+                )
+            )
+            touched[(sensor["sensor_id"], sensor["parameter"])].update(by_date)
+    return hour_ops, stats_ops, touched
+
+
+def _day_match(touched, period):
+    # Aligned to whole periods, so every regrouped period sees all of its days
+    dates = set().union(*touched.values())
+    start, end = period_bounds(dates, period)
+    return {
+        "$match": {
+            "sensor_id": {"$in": sorted({sid for sid, _ in touched})},
+            "parameter": {"$in": sorted({p for _, p in touched})},
+            "date": {"$gte": start, "$lte": end},
+        }
+    }
+
+
+def period_pipeline(touched, period):
+    """Regroup the touched sensors' daily rollups into W or M period documents."""
+    trunc = {
+        "date": {"$dateFromString": {"dateString": "$date"}},
+        "unit": PERIODS[period],
+    }
+    if period == "W":
+        trunc["startOfWeek"] = "monday"
+        label = {"$dateAdd": {"startDate": "$_id.start", "unit": "day", "amount": 6}}
+    else:
+        label = {
+            "$dateAdd": {
+                "startDate": {
+                    "$dateAdd": {
+                        "startDate": "$_id.start",
+                        "unit": "month",
+                        "amount": 1,
+                    }
+                },
+                "unit": "day",
+                "amount": -1,
+            }
+        }
+    start = {"$dateTrunc": trunc}
+    return [
+        _day_match(touched, period),
+        {
+            "$group": {
+                "_id": {
+                    "sensor_id": "$sensor_id",
+                    "parameter": "$parameter",
+                    "start": start,
+                },
+                "location_id": {"$first": "$location_id"},
+                "units": {"$first": "$units"},
+                "count": {"$sum": "$count"},
+                "sum": {"$sum": "$sum"},
+                "min": {"$min": "$min"},
+                "max": {"$max": "$max"},
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "sensor_id": "$_id.sensor_id",
+                "parameter": "$_id.parameter",
+                "period": period,
+                "date": {"$dateToString": {"date": label, "format": "%Y-%m-%d"}},
+                "location_id": 1,
+                "units": 1,
+                "count": 1,
+                "sum": 1,
+                "min": 1,
+                "max": 1,
+                "mean": {"$divide": ["$sum", "$count"]},
+            }
+        },
+        {
+            "$merge": {
+                "into": PERIOD_COLLECTION,
+                "on": ["sensor_id", "parameter", "period", "date"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert",
+            }
+        },
+    ]
+
+
+def profile_pipeline(touched):
+    """Regroup the touched sensors' daily rollups into monthly hour-of-week sums."""
+    return [
+        _day_match(touched, "M"),
+        {
+            "$set": {
+                "_dow": {"$isoDayOfWeek": {"$dateFromString": {"dateString": "$date"}}},
+                "_hours": {"$objectToArray": "$hours"},
+            }
+        },
+        {"$unwind": "$_hours"},
+        {
+            "$group": {
+                "_id": {
+                    "sensor_id": "$sensor_id",
+                    "parameter": "$parameter",
+                    "month": {"$substrBytes": ["$date", 0, 7]},
+                    "dow": "$_dow",
+                    "hour": {"$toInt": "$_hours.k"},
+                },
+                "location_id": {"$first": "$location_id"},
+                "sum": {"$sum": "$_hours.v"},
+                "count": {"$sum": 1},
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "sensor_id": "$_id.sensor_id",
+                    "parameter": "$_id.parameter",
+                    "month": "$_id.month",
+                },
+                "location_id": {"$first": "$location_id"},
+                "cells": {
+                    "$push": {
+                        "dow": "$_id.dow",
+                        "hour": "$_id.hour",
+                        "sum": "$sum",
+                        "count": "$count",
+                    }
+                },
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "sensor_id": "$_id.sensor_id",
+                "parameter": "$_id.parameter",
+                "month": "$_id.month",
+                "location_id": 1,
+                "cells": 1,
+            }
+        },
+        {
+            "$merge": {
+                "into": PROFILE_COLLECTION,
+                "on": ["sensor_id", "parameter", "month"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert",
+            }
+        },
+    ]
+
+
+def update_rollups(db, structured, batch_size=BULK_BATCH_SIZE):
+    """Fold nested-shaped location documents into every rollup collection.
+
+    Daily rollups are updated in place; the weekly, monthly and hour-of-week
+    documents they feed are then regrouped from the daily ones with $merge, so
+    the whole update is safe to repeat. Needs MongoDB 5.0+ and the unique
+    indexes from etl.mongo_indexes.
+    """
+    hour_ops, stats_ops, touched = build_daily_operations(structured)
+    if not touched:
+        return
+
+    daily = db[DAILY_COLLECTION]
+    for operations in (hour_ops, stats_ops):
+        for i in range(0, len(operations), batch_size):
+            daily.bulk_write(operations[i : i + batch_size], ordered=False)
+
+    for period in PERIODS:
+        list(daily.aggregate(period_pipeline(touched, period)))
+    list(daily.aggregate(profile_pipeline(touched)))
+
+
+# -----------------------------
+# Rebuild
+# -----------------------------
+
+
+def rebuild(db, layout=STORAGE_LAYOUT, locations_per_batch=50):
+    """Build the rollups for everything already stored in `layout` (safe to re-run)."""
+    rebuilt = 0
+    for batch in iter_structured_batches(db, layout, locations_per_batch):
+        update_rollups(db, batch)
+        rebuilt += len(batch)
+        print(f"Rolled up {rebuilt} locations...")
+
+    print(f"✔ Rolled up {rebuilt} locations ({layout}).")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("Usage: python -m etl.rollup_store rebuild")
+        sys.exit(1)
+    # Imported here: etl.mongo_indexes itself imports this module's constants
+    from etl.mongo_indexes import ensure_indexes
+
+    db = MongoClient(MONGO_URI)[DB_NAME]
+    ensure_indexes(db, STORAGE_LAYOUT)  # $merge needs the unique rollup keys
+    rebuild(db, STORAGE_LAYOUT)
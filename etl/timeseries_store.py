@@ -0,0 +1,129 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pymongo import MongoClient, DeleteMany
+from dotenv import load_dotenv
+from etl.bucket_store import location_upsert, LOCATIONS_COLLECTION
+
+# Time-series storage layout: location metadata in the small locations
+# collection, one measurement per document in a native time-series collection
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DB_NAME = "air_quality"
+NESTED_COLLECTION = "us_air_data"
+TIMESERIES_COLLECTION = "measurements_ts"
+BULK_BATCH_SIZE = int(os.getenv("MONGO_BULK_BATCH_SIZE", "1000"))
+TIMESERIES_OPTIONS = {
+    "timeField": "datetime",
+    "metaField": "meta",
+    "granularity": "hours",
+}
+
+
+def ensure_timeseries_collection(db):
+    """Create the time-series collection on first use.
+
+    Time-series collections need MongoDB 5.0+; the loads below also delete by
+    timeField, which needs 7.0+.
+    """
+    existing = list(db.list_collections(filter={"name": TIMESERIES_COLLECTION}))
+    if not existing:
+        db.create_collection(TIMESERIES_COLLECTION, timeseries=TIMESERIES_OPTIONS)
+    elif existing[0].get("type") != "timeseries":
+        # e.g. created implicitly by an insert or create_index before this ran
+        raise RuntimeError(
+            f"'{TIMESERIES_COLLECTION}' exists but is not a time-series "
+            "collection; drop it (or run the migration into a fresh database)"
+        )
+    return db[TIMESERIES_COLLECTION]
+
+
+def measurement_documents(loc, sensor):
+    """One time-series document per nested measurement of `sensor`."""
+    meta = {
+        "location_id": loc["location_id"],
+        "sensor_id": sensor["sensor_id"],
+        "parameter": sensor["parameter"],
+        "units": sensor.get("units", "unknown"),
+    }
+    for m in sensor.get("measurements", []):
+        day = datetime.strptime(m["date"], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        yield {
+            "datetime": day + timedelta(hours=m["hour"]),
+            "meta": meta,
+            "value": m["value"],
+        }
+
+
+def load_structured_timeseries(db, structured, batch_size=BULK_BATCH_SIZE):
+    """Write nested-shaped location documents into the time-series layout.
+
+    Time-series collections have no unique indexes, so the exact (sensor,
+    parameter, datetime) keys being written are deleted first; re-running a
+    load therefore replaces rather than duplicates measurements, and stored
+    points missing from the batch are left alone. Deleting by timeField needs
+    MongoDB 7.0+. The delete and the insert are separate writes: a load that
+    dies between them leaves those points missing until it is re-run, which
+    both load paths support.
+    """
+    measurements = ensure_timeseries_collection(db)
+    location_ops, delete_ops, docs = [], [], []
+
+    for loc in structured:
+        if not loc.get("sensors"):
+            continue
+        location_ops.append(location_upsert(loc))
+        for sensor in loc["sensors"]:
+            sensor_docs = list(measurement_documents(loc, sensor))
+            if not sensor_docs:
+                continue
+            delete_ops.append(
+                DeleteMany(
+                    {
+                        "meta.sensor_id": sensor["sensor_id"],
+                        "meta.parameter": sensor["parameter"],
+                        "datetime": {"$in": [d["datetime"] for d in sensor_docs]},
+                    }
+                )
+            )
+            docs.extend(sensor_docs)
+
+    for i in range(0, len(location_ops), batch_size):
+        db[LOCATIONS_COLLECTION].bulk_write(
+            location_ops[i : i + batch_size], ordered=False
+        )
+    for i in range(0, len(delete_ops), batch_size):
+        measurements.bulk_write(delete_ops[i : i + batch_size], ordered=False)
+    for i in range(0, len(docs), batch_size):
+        measurements.insert_many(docs[i : i + batch_size], ordered=False)
+
+
+# -----------------------------
+# Migration
+# -----------------------------
+
+
+def migrate_nested_to_timeseries(db, locations_per_batch=50):
+    """Copy every us_air_data document into the time-series layout."""
+    batch = []
+    migrated = 0
+    for doc in db[NESTED_COLLECTION].find({}, {"_id": 0}):
+        batch.append(doc)
+        if len(batch) >= locations_per_batch:
+            load_structured_timeseries(db, batch)
+            migrated += len(batch)
+            print(f"Migrated {migrated} locations...")
+            batch.clear()
+
+    if batch:
+        load_structured_timeseries(db, batch)
+        migrated += len(batch)
+
+    print(f"✔ Migrated {migrated} locations into '{TIMESERIES_COLLECTION}'.")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["migrate"]:
+        print("Usage: python -m etl.timeseries_store migrate")
+        sys.exit(1)
+    migrate_nested_to_timeseries(MongoClient(MONGO_URI)[DB_NAME])
@@ -1,38 +1,22 @@
 import os
 import json
 import pandas as pd
-import numpy as np
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
+from etl.raw_store import read_sensor_frame
 
 # Load environment variables (optional but future-proof)
 load_dotenv()
 
 # Constants
-BASE_FOLDER = "data/data_by_sensor"
 LOCATION_FILE = "data/active_locations_filtered.jsonl"
 SENSOR_UNITS_FILE = "data/active_sensor_info.jsonl"
 OUTPUT_FILE = "data/US_data_structured_cleaned.json"
+TRANSFORM_WORKERS = int(os.getenv("TRANSFORM_WORKERS", os.cpu_count() or 1))
 
 # ---- Helpers ----
 
 
-def convert_types(obj):
-    """Recursively convert types to JSON serializable format."""
-    if isinstance(obj, dict):
-        return {k: convert_types(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_types(i) for i in obj]
-    elif isinstance(obj, (np.int64, np.int32)):
-        return int(obj)
-    elif isinstance(obj, (np.float64, np.float32)):
-        return float(obj)
-    elif isinstance(obj, (pd.Timestamp, datetime)):
-        return obj.isoformat()
-    else:
-        return obj
-
-
 def load_sensor_units(path):
     sensor_units = {}
     with open(path, "r") as f:
@@ -43,89 +27,100 @@ def load_sensor_units(path):
     return sensor_units
 
 
-def load_sensor_data(sensor_ids, base_folder):
-    all_data = []
-    for sensor_id in sensor_ids:
-        folder_path = os.path.join(base_folder, f"sensor_{sensor_id}")
-        if not os.path.isdir(folder_path):
-            continue
-        for filename in os.listdir(folder_path):
-            if filename.endswith(".jsonl") and filename.startswith("sensor_"):
-                file_path = os.path.join(folder_path, filename)
-                with open(file_path, "r") as f:
-                    for line in f:
-                        record = json.loads(line)
-                        record["sensor_id"] = sensor_id
-                        all_data.append(record)
-    return all_data
+def build_measurements(group):
+    """Nested measurement records for one sensor, built column-wise.
+
+    to_dict("records") yields native Python scalars, so no per-row
+    type conversion is needed before json.dump.
+    """
+    return group[["date", "hour", "value"]].to_dict("records")
 
 
 # ---- Main Transformation ----
 
 
-def transform_historical_data():
+def transform_location(loc, sensor_units_map):
+    """Build one location document, serialized; None if it has no sensor data."""
+    location_entry = {
+        "location_id": loc["id"],
+        "location_name": loc["name"],
+        "country": loc["country"],
+        "locality": loc.get("locality"),
+        "coordinates": loc.get("coordinates"),
+        "sensors": [],
+    }
+
+    df = read_sensor_frame(loc["active_sensor_ids"])
+    if df.empty:
+        return None
+
+    df.dropna(subset=["datetime", "parameter", "value"], inplace=True)
+    df.drop_duplicates(subset=["sensor_id", "datetime", "parameter"], inplace=True)
+    df["datetime"] = pd.to_datetime(df["datetime"], utc=True)
+    df["date"] = df["datetime"].dt.strftime("%Y-%m-%d")
+    df["hour"] = df["datetime"].dt.hour
+
+    grouped = df.groupby(["sensor_id", "parameter"])
+    for (sensor_id, parameter), group in grouped:
+        units = sensor_units_map.get((sensor_id, parameter), "unknown")
+        location_entry["sensors"].append(
+            {
+                "sensor_id": int(sensor_id),
+                "parameter": parameter,
+                "units": units,
+                "measurements": build_measurements(group),
+            }
+        )
+
+    return json.dumps(location_entry, indent=2)
+
+
+# Each worker process receives the units map once, not once per location
+_worker_units_map = None
+
+
+def _init_worker(sensor_units_map):
+    global _worker_units_map
+    _worker_units_map = sensor_units_map
+
+
+def _transform_in_worker(loc):
+    return transform_location(loc, _worker_units_map)
+
+
+def transform_historical_data(workers=TRANSFORM_WORKERS):
     print("⏳ Starting transformation of historical sensor data...")
     sensor_units_map = load_sensor_units(SENSOR_UNITS_FILE)
 
+    with open(LOCATION_FILE, "r", encoding="utf-8") as loc_file:
+        locations = [json.loads(line) for line in loc_file]
+
     with open(OUTPUT_FILE, "w", encoding="utf-8") as fout:
         fout.write("[\n")
+        first = True
 
-    first = True
-    with open(LOCATION_FILE, "r", encoding="utf-8") as loc_file:
-        for line in loc_file:
-            loc = json.loads(line)
-            location_entry = {
-                "location_id": loc["id"],
-                "location_name": loc["name"],
-                "country": loc["country"],
-                "locality": loc.get("locality"),
-                "coordinates": loc.get("coordinates"),
-                "sensors": [],
-            }
-
-            all_sensor_data = load_sensor_data(loc["active_sensor_ids"], BASE_FOLDER)
-            if not all_sensor_data:
-                continue
-
-            df = pd.DataFrame(all_sensor_data)
-            df.dropna(subset=["datetime", "parameter", "value"], inplace=True)
-            df.drop_duplicates(
-                subset=["sensor_id", "datetime", "parameter"], inplace=True
-            )
-            df["datetime"] = pd.to_datetime(df["datetime"], utc=True)
-            df["date"] = df["datetime"].dt.date
-            df["hour"] = df["datetime"].dt.hour
-
-            grouped = df.groupby(["sensor_id", "parameter"])
-            for (sensor_id, parameter), group in grouped:
-                units = sensor_units_map.get((sensor_id, parameter), "unknown")
-                measurements = [
-                    {
-                        "date": row["date"].isoformat(),
-                        "hour": int(row["hour"]),
-                        "value": row["value"],
-                    }
-                    for _, row in group.iterrows()
-                ]
-                location_entry["sensors"].append(
-                    {
-                        "sensor_id": sensor_id,
-                        "parameter": parameter,
-                        "units": units,
-                        "measurements": measurements,
-                    }
-                )
-
-            # Write to file
-            location_entry = convert_types(location_entry)
-            with open(OUTPUT_FILE, "a", encoding="utf-8") as fout:
+        def write(documents):
+            nonlocal first
+            for document in documents:
+                if document is None:
+                    continue
                 if not first:
                     fout.write(",\n")
                 else:
                     first = False
-                json.dump(location_entry, fout, indent=2)
+                fout.write(document)
+
+        if workers > 1:
+            # map() yields results in input order, so output stays deterministic
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(sensor_units_map,),
+            ) as executor:
+                write(executor.map(_transform_in_worker, locations, chunksize=4))
+        else:
+            write(transform_location(loc, sensor_units_map) for loc in locations)
 
-    with open(OUTPUT_FILE, "a", encoding="utf-8") as fout:
         fout.write("\n]")
 
     print("✔ Transformation complete. Data saved to:", OUTPUT_FILE)
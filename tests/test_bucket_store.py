@@ -0,0 +1,31 @@
+from etl import bucket_store
+
+
+def test_bucket_hours_are_pulled_before_their_new_readings_are_pushed():
+    location = {
+        "location_id": 1,
+        "location_name": "Station",
+        "country": "United States",
+        "sensors": [
+            {
+                "sensor_id": 10,
+                "parameter": "pm25",
+                "units": "µg/m³",
+                "measurements": [
+                    {"date": "2024-01-01", "hour": 3, "value": 2.5},
+                    {"date": "2024-01-01", "hour": 4, "value": 3.0},
+                ],
+            }
+        ],
+    }
+
+    phases = bucket_store.build_bucket_operations([location])
+
+    (_, pulls), (_, pushes) = phases[1], phases[2]
+    bucket = {"sensor_id": 10, "parameter": "pm25", "date": "2024-01-01"}
+    assert pulls[0]._filter == bucket
+    assert pulls[0]._doc == {"$pull": {"measurements": {"hour": {"$in": [3, 4]}}}}
+    assert pushes[0]._filter == bucket and pushes[0]._upsert
+    assert pushes[0]._doc["$push"] == {
+        "measurements": {"$each": [{"hour": 3, "value": 2.5}, {"hour": 4, "value": 3.0}]}
+    }
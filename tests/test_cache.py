@@ -0,0 +1,72 @@
+from unittest import mock
+
+import pandas as pd
+
+from dashboard import cache as dc
+
+
+def test_memory_cache_expires_entries_after_the_ttl():
+    store = dc.MemoryCache(ttl=10)
+    with mock.patch.object(dc.time, "monotonic", return_value=100.0):
+        store.set("key", 1)
+        assert store.get("key") == (True, 1)
+    with mock.patch.object(dc.time, "monotonic", return_value=111.0):
+        assert store.get("key") == (False, None)
+    assert "key" not in store.entries
+
+
+def test_memory_cache_evicts_the_least_recently_used_entry():
+    store = dc.MemoryCache(max_entries=2)
+    store.set("a", 1)
+    store.set("b", 2)
+    store.get("a")
+    store.set("c", 3)
+
+    assert store.get("b") == (False, None)
+    assert store.get("a") == (True, 1)
+    assert store.get("c") == (True, 3)
+
+
+def test_filesystem_cache_expires_entries_after_the_ttl(tmp_path):
+    store = dc.FileSystemCache(str(tmp_path), ttl=10)
+    with mock.patch.object(dc.time, "time", return_value=1000.0):
+        store.set("key", {"rows": [1, 2]})
+        assert store.get("key") == (True, {"rows": [1, 2]})
+    with mock.patch.object(dc.time, "time", return_value=1011.0):
+        assert store.get("key") == (False, None)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_filesystem_cache_evicts_the_oldest_files(tmp_path):
+    store = dc.FileSystemCache(str(tmp_path), max_entries=2)
+    mtimes = {}
+    for i, key in enumerate(["a", "b"]):
+        store.set(key, key)
+        mtimes[key] = 1000.0 + i
+        dc.os.utime(store._path(key), (mtimes[key], mtimes[key]))
+    dc.os.utime(store._path("a"), (2000.0, 2000.0))  # Most recently read
+    store.set("c", "c")
+
+    assert store.get("b") == (False, None)
+    assert store.get("a") == (True, "a")
+    assert store.get("c") == (True, "c")
+
+
+def test_memoize_reuses_results_until_the_version_changes(monkeypatch):
+    monkeypatch.setattr(dc, "VERSION_CHECK_SECONDS", 0)
+    version = {"loaded_at": 1}
+    calls = []
+
+    @dc.memoize(version=lambda: version["loaded_at"], cache=dc.MemoryCache())
+    def query(name):
+        calls.append(name)
+        return pd.DataFrame({"value": [len(calls)]})
+
+    first = query("x")
+    first.loc[0, "value"] = -1  # Callers get a copy, never the cached frame
+    assert query("x")["value"].tolist() == [1]
+    assert calls == ["x"]
+
+    version["loaded_at"] = 2
+    assert query("x")["value"].tolist() == [2]
+    assert calls == ["x", "x"]
@@ -0,0 +1,44 @@
+import json
+from types import SimpleNamespace
+from unittest import mock
+from datetime import datetime, timezone
+
+from etl import extract_locations as el
+
+
+def location(location_id):
+    return {
+        "id": location_id,
+        "name": f"Location {location_id}",
+        "country": "United States",
+        "sensors": [{"sensor_id": location_id * 10}],
+    }
+
+
+def test_failed_probes_are_not_checkpointed(monkeypatch, tmp_path):
+    now = datetime.now(timezone.utc).isoformat()
+    latest = {1: None, 2: {}, 3: {30: now}}  # Probe failed, idle, active
+    monkeypatch.setattr(el, "fetch_latest_by_sensor", latest.get)
+
+    input_file = tmp_path / "locations.json"
+    input_file.write_text(json.dumps([location(i) for i in latest]))
+    output_file = tmp_path / "active.jsonl"
+    resume_file = tmp_path / "processed.txt"
+
+    el.filter_and_save_active_locations(
+        str(input_file), str(output_file), str(resume_file), workers=2
+    )
+
+    assert el.load_processed_ids(str(output_file), str(resume_file)) == {2, 3}
+    saved = [json.loads(line) for line in output_file.read_text().splitlines()]
+    assert [(s["id"], s["active_sensor_ids"]) for s in saved] == [(3, [30])]
+
+
+def test_permanent_probe_errors_count_as_inactive(monkeypatch):
+    get = mock.Mock(return_value=SimpleNamespace(status_code=404, text=""))
+    monkeypatch.setattr(el, "CLIENT", SimpleNamespace(get=get))
+    assert el.fetch_latest_by_sensor(1) == {}
+    assert el.filter_active_sensors(location(1)) is None
+
+    get.return_value = SimpleNamespace(status_code=503, text="")
+    assert el.fetch_latest_by_sensor(1) is None
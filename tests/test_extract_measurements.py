@@ -0,0 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from etl import extract_measurements as em
+
+SENSOR = {"sensor_id": 7, "location_name": "Test"}
+
+
+def page(rows, status=200):
+    return SimpleNamespace(
+        status_code=status, json=lambda: {"results": rows}, headers={}
+    )
+
+
+def entry(i):
+    return {
+        "value": float(i),
+        "parameter": {"name": "pm25"},
+        "period": {"datetimeFrom": {"utc": f"2024-01-01T{i % 24:02d}:00:00Z"}},
+    }
+
+
+@pytest.fixture
+def window(monkeypatch, tmp_path):
+    monkeypatch.setattr(em, "WINDOW_RESUME_FILE", str(tmp_path / "window.txt"))
+    monkeypatch.setattr(em, "write_sensor_batch", mock.Mock())
+    get = mock.Mock()
+    monkeypatch.setattr(em, "CLIENT", SimpleNamespace(get=get))
+    return get
+
+
+def test_fetch_measurements_raises_on_failed_page(window):
+    window.side_effect = [page([entry(i) for i in range(em.LIMIT)]), page([], 500)]
+
+    with pytest.raises(em.FetchError):
+        em.fetch_measurements(7, em.START_DATE, em.END_DATE)
+
+
+def test_fetch_measurements_wraps_network_errors(window):
+    window.side_effect = ConnectionError("reset")
+
+    with pytest.raises(em.FetchError):
+        em.fetch_measurements(7, em.START_DATE, em.END_DATE)
+
+
+def test_failed_chunk_is_not_checkpointed(window):
+    window.side_effect = [page([entry(1), entry(2)]), page([], 503)]
+
+    em.process_sensor_window(SENSOR, em.END_DATE)
+
+    first_chunk_start = em.END_DATE - timedelta(days=em.CHUNK_DAYS)
+    assert em.load_window_resume() == {
+        7: first_chunk_start.replace(microsecond=0)
+    }
+    assert window.call_count == 2
+    em.write_sensor_batch.assert_called_once()
+
+
+def test_empty_chunks_walk_to_the_window_start(window):
+    window.side_effect = lambda *args, **kwargs: page([])
+
+    em.process_sensor_window(SENSOR, em.END_DATE)
+
+    assert em.load_window_resume()[7] <= em.START_DATE
+
+
+def test_fetch_measurements_skips_permanent_client_errors(window):
+    window.return_value = page([], 404)
+
+    assert em.fetch_measurements(7, em.START_DATE, em.END_DATE) == []
+    assert window.call_count == 1
+
+
+def test_chunk_completes_past_a_missing_sensor(window, monkeypatch, tmp_path):
+    monkeypatch.setattr(em, "RESUME_FILE", str(tmp_path / "resume.txt"))
+    retired = em.MEASUREMENTS_PATH.format(2)
+    window.side_effect = lambda path, **kwargs: (
+        page([], 404) if path == retired else page([entry(1)])
+    )
+    sensors = [{"sensor_id": i, "location_name": "Test"} for i in (1, 2, 3)]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert em.extract_chunk(sensors, em.START_DATE, em.END_DATE, executor)
+
+    assert em.load_resume() == (em.END_DATE.replace(microsecond=0), 3)
+    assert em.write_sensor_batch.call_count == 2
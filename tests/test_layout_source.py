@@ -0,0 +1,79 @@
+from datetime import datetime
+
+from etl import layout_source
+from etl.bucket_store import LOCATIONS_COLLECTION, BUCKETS_COLLECTION
+from etl.timeseries_store import TIMESERIES_COLLECTION
+
+
+class FakeCursor(list):
+    def sort(self, key, direction):
+        return FakeCursor(sorted(self, key=lambda d: d[key]))
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection):
+        # Only the {"<field>": {"$in": ids}} queries issued by the readers
+        docs = self.docs
+        for field, condition in query.items():
+            docs = [d for d in docs if _get(d, field) in condition["$in"]]
+        return FakeCursor(dict(d) for d in docs)
+
+
+def _get(doc, path):
+    for part in path.split("."):
+        doc = doc[part]
+    return doc
+
+
+LOCATION = {
+    "location_id": 1,
+    "location_name": "A",
+    "sensors": [{"sensor_id": 10, "parameter": "pm25", "units": "µg/m³"}],
+}
+EXPECTED = [
+    {"date": "2024-01-01", "hour": 23, "value": 1.0},
+    {"date": "2024-01-02", "hour": 0, "value": 2.0},
+]
+
+
+def test_bucketed_layout_is_read_back_as_nested_documents():
+    db = {
+        LOCATIONS_COLLECTION: FakeCollection([LOCATION]),
+        BUCKETS_COLLECTION: FakeCollection(
+            [
+                {
+                    "location_id": 1,
+                    "sensor_id": 10,
+                    "parameter": "pm25",
+                    "date": day,
+                    "measurements": [{"hour": m["hour"], "value": m["value"]}],
+                }
+                for day, m in zip(["2024-01-02", "2024-01-01"], EXPECTED[::-1])
+            ]
+        ),
+    }
+
+    (batch,) = layout_source.iter_structured_batches(db, "bucketed")
+
+    assert batch[0]["sensors"][0]["measurements"] == EXPECTED
+
+
+def test_timeseries_layout_is_read_back_as_nested_documents():
+    meta = {"location_id": 1, "sensor_id": 10, "parameter": "pm25"}
+    db = {
+        LOCATIONS_COLLECTION: FakeCollection([LOCATION]),
+        TIMESERIES_COLLECTION: FakeCollection(
+            [
+                {"datetime": datetime(2024, 1, 2, 0), "meta": meta, "value": 2.0},
+                {"datetime": datetime(2024, 1, 1, 23), "meta": meta, "value": 1.0},
+            ]
+        ),
+    }
+
+    (batch,) = layout_source.iter_structured_batches(db, "timeseries")
+
+    assert batch[0]["location_name"] == "A"
+    assert batch[0]["sensors"][0]["measurements"] == EXPECTED
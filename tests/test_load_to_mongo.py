@@ -0,0 +1,56 @@
+import bson
+import pytest
+
+from etl import load_to_mongo
+
+
+def location(sensors, hours):
+    return {
+        "location_id": 1234,
+        "location_name": "Station",
+        "country": "United States",
+        "locality": "Somewhere",
+        "coordinates": {"latitude": 40.1, "longitude": -75.2},
+        "sensors": [
+            {
+                "sensor_id": 100 + i,
+                "parameter": "pm25",
+                "units": "µg/m³",
+                "measurements": [
+                    {"date": "2024-01-01", "hour": h % 24, "value": h / 3}
+                    for h in range(hours)
+                ],
+            }
+            for i in range(sensors)
+        ],
+    }
+
+
+@pytest.mark.parametrize("sensors,hours", [(1, 24), (3, 2160), (6, 500)])
+def test_size_estimate_tracks_bson_size(sensors, hours):
+    record = location(sensors, hours)
+    actual = len(bson.encode(record))
+    assert load_to_mongo.estimated_bson_size(record) == pytest.approx(actual, rel=0.1)
+
+
+def test_byte_batches_split_on_estimated_size():
+    records = [location(1, 1000) for _ in range(10)]
+    per_record = load_to_mongo.estimated_bson_size(records[0])
+
+    batches = list(load_to_mongo.byte_batches(records, target_bytes=3 * per_record))
+
+    assert [len(b) for b in batches] == [3, 3, 3, 1]
+
+
+def test_checkpoint_is_discarded_when_the_input_changes(tmp_path):
+    input_file = tmp_path / "structured.json"
+    input_file.write_text("[]")
+    checkpoint = str(tmp_path / "checkpoint.txt")
+
+    load_to_mongo.save_checkpoint([1, 2], str(input_file), checkpoint)
+    load_to_mongo.save_checkpoint([3], str(input_file), checkpoint)
+    assert load_to_mongo.load_checkpoint(str(input_file), checkpoint) == {1, 2, 3}
+
+    input_file.write_text('[{"location_id": 1}]')
+    assert load_to_mongo.load_checkpoint(str(input_file), checkpoint) == set()
+    assert not (tmp_path / "checkpoint.txt").exists()
@@ -0,0 +1,72 @@
+import pandas as pd
+
+from dashboard import map_helpers as mh
+
+
+def markers():
+    return pd.DataFrame(
+        {
+            "location_id": [1, 2, 3],
+            "location_name": ["A", "B", "C"],
+            "locality": ["a", "b", "c"],
+            "lat": [40.0, 41.0, 35.0],
+            "lon": [-100.0, -98.0, -80.0],
+            "parameter": ["pm25"] * 3,
+            "value": [5.0, 40.0, 8.0],
+            "category": ["Good", "Unhealthy", "Moderate"],
+        }
+    )
+
+
+def test_zoomed_out_grid_merges_every_location():
+    clusters = mh.cluster_markers(markers(), zoom=0)
+
+    assert len(clusters) == 1
+    cluster = clusters.iloc[0]
+    assert cluster["count"] == 3
+    assert cluster["location_name"] == "3 stations"
+    assert cluster["category"] == "Unhealthy"  # Worst category wins
+    assert pd.isna(cluster["location_id"])
+
+
+def test_finer_grid_splits_clusters_and_passes_singletons_through():
+    clusters = mh.cluster_markers(markers(), zoom=3).sort_values("lon")
+
+    assert clusters["count"].tolist() == [2, 1]
+    pair, single = clusters.iloc[0], clusters.iloc[1]
+    assert (pair["lat"], pair["lon"]) == (40.5, -99.0)
+    assert pair["location_name"] == "2 stations"
+    assert single["location_id"] == 3
+    assert single["location_name"] == "C"
+    assert (single["lat"], single["lon"], single["value"]) == (35.0, -80.0, 8.0)
+
+
+def test_max_zoom_shows_every_location_in_the_viewport():
+    bounds = (-101.0, 39.0, -97.0, 42.0)
+    shown = mh.cluster_markers(markers(), zoom=mh.CLUSTER_MAX_ZOOM, bounds=bounds)
+
+    assert shown["location_id"].tolist() == [1, 2]
+    assert shown["count"].tolist() == [1, 1]
+
+
+def test_viewport_without_zoom_uses_the_default_zoom():
+    corners = [[-100, 45], [-90, 45], [-90, 35], [-100, 35]]
+    relayout = {"mapbox._derived": {"coordinates": corners}}
+
+    assert mh.viewport_from_relayout(relayout) == (
+        mh.MAP_ZOOM,
+        (-100, 35, -90, 45),
+    )
+
+
+def test_viewport_without_center_or_corners_has_no_bounds():
+    assert mh.viewport_from_relayout({"mapbox.zoom": 6}) == (6, None)
+    assert mh.viewport_from_relayout({"mapbox.center": {"lat": 1, "lon": 2}}) == (
+        mh.MAP_ZOOM,
+        None,
+    )
+
+
+def test_non_map_relayouts_are_ignored():
+    assert mh.viewport_from_relayout(None) is None
+    assert mh.viewport_from_relayout({"autosize": True}) is None
@@ -0,0 +1,94 @@
+import pytest
+
+from etl import mongo_indexes
+from etl.timeseries_store import TIMESERIES_COLLECTION
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db, self.name = db, name
+
+    def create_index(self, keys, **options):
+        # Like MongoDB, indexing a missing collection creates a regular one
+        self.db.collections.setdefault(self.name, "collection")
+        self.db.events.append(("create_index", self.name))
+        return f"{self.name}:{keys}"
+
+
+class FakeDB:
+    def __init__(self, collections=None):
+        self.collections = dict(collections or {})  # name -> type
+        self.events = []
+
+    def __getitem__(self, name):
+        return FakeCollection(self, name)
+
+    def list_collections(self, filter):
+        name = filter["name"]
+        if name in self.collections:
+            return [{"name": name, "type": self.collections[name]}]
+        return []
+
+    def create_collection(self, name, **options):
+        assert "timeseries" in options
+        self.collections[name] = "timeseries"
+        self.events.append(("create_collection", name))
+
+
+def test_timeseries_collection_created_before_its_indexes():
+    db = FakeDB()
+
+    mongo_indexes.ensure_indexes(db, "timeseries")
+
+    assert db.collections[TIMESERIES_COLLECTION] == "timeseries"
+    events = [e for e in db.events if e[1] == TIMESERIES_COLLECTION]
+    assert events[0] == ("create_collection", TIMESERIES_COLLECTION)
+    assert ("create_index", TIMESERIES_COLLECTION) in events[1:]
+
+
+def test_existing_timeseries_collection_is_reused():
+    db = FakeDB({TIMESERIES_COLLECTION: "timeseries"})
+
+    mongo_indexes.ensure_indexes(db, "timeseries")
+
+    assert ("create_collection", TIMESERIES_COLLECTION) not in db.events
+
+
+def test_regular_collection_in_place_of_timeseries_is_rejected():
+    db = FakeDB({TIMESERIES_COLLECTION: "collection"})
+
+    with pytest.raises(RuntimeError):
+        mongo_indexes.ensure_indexes(db, "timeseries")
+
+
+class IndexedCollection:
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.dropped = []
+
+    def index_information(self):
+        return self.indexes
+
+    def drop_index(self, name):
+        self.dropped.append(name)
+
+
+def test_duplicates_merged_only_before_the_unique_index_exists(monkeypatch):
+    dedupe = []
+    monkeypatch.setattr(
+        mongo_indexes, "dedupe_locations", lambda db: dedupe.append(db) or 0
+    )
+    plain = IndexedCollection({"location_id_1": {"key": [("location_id", 1)]}})
+
+    mongo_indexes.prepare_unique_location_index({"us_air_data": plain})
+
+    assert plain.dropped == ["location_id_1"]
+    assert len(dedupe) == 1
+
+    unique = IndexedCollection(
+        {"location_id_1": {"key": [("location_id", 1)], "unique": True}}
+    )
+    mongo_indexes.prepare_unique_location_index({"us_air_data": unique})
+
+    assert unique.dropped == []
+    assert len(dedupe) == 1
@@ -0,0 +1,168 @@
+from etl import nested_store
+
+
+def test_nested_upsert_merges_instead_of_replacing():
+    location = {
+        "location_id": 1,
+        "location_name": "Renamed",
+        "country": "United States",
+        "coordinates": {"latitude": 1.0, "longitude": 2.0},
+        "content_hash": "abc",
+        "sensors": [
+            {
+                "sensor_id": 10,
+                "parameter": "pm25",
+                "units": "µg/m³",
+                "measurements": [{"date": "2024-01-01", "hour": 0, "value": 1.0}],
+            }
+        ],
+    }
+
+    location_ops, sensor_ops, pull_ops, push_ops = nested_store.build_nested_operations(
+        [location]
+    )
+
+    (upsert,) = location_ops
+    assert upsert._upsert
+    assert upsert._doc["$set"] == {
+        "location_name": "Renamed",
+        "country": "United States",
+        "locality": None,
+        "coordinates": {"latitude": 1.0, "longitude": 2.0},
+    }
+    assert upsert._doc["$setOnInsert"] == {"sensors": []}
+    assert list(sensor_ops[0]._doc) == ["$push"]
+    assert pull_ops[0]._doc == {
+        "$pull": {
+            "sensors.$.measurements": {
+                "$or": [{"date": "2024-01-01", "hour": {"$in": [0]}}]
+            }
+        }
+    }
+    assert push_ops[0]._doc == {
+        "$set": {"sensors.$.units": "µg/m³"},
+        "$push": {
+            "sensors.$.measurements": {
+                "$each": [{"date": "2024-01-01", "hour": 0, "value": 1.0}]
+            }
+        },
+    }
+
+
+class FakeNestedCollection:
+    """Applies the update shapes nested_store writes to in-memory documents."""
+
+    def __init__(self):
+        self.docs = []
+
+    def _find(self, query):
+        for doc in self.docs:
+            if doc["location_id"] != query["location_id"]:
+                continue
+            sensor_ids = [s["sensor_id"] for s in doc["sensors"]]
+            wanted = query.get("sensors.sensor_id")
+            if wanted is None:
+                return doc, None
+            if isinstance(wanted, dict):
+                if wanted["$ne"] not in sensor_ids:
+                    return doc, None
+            elif wanted in sensor_ids:
+                return doc, doc["sensors"][sensor_ids.index(wanted)]
+        return None, None
+
+    def bulk_write(self, operations, ordered=True):
+        for op in operations:
+            doc, sensor = self._find(op._filter)
+            update = op._doc
+            if doc is None:
+                if not op._upsert:
+                    continue
+                doc = {"location_id": op._filter["location_id"]}
+                doc.update(update.get("$setOnInsert", {}))
+                self.docs.append(doc)
+            for path, value in update.get("$set", {}).items():
+                if path.startswith("sensors.$."):
+                    sensor[path.split(".")[-1]] = value
+                else:
+                    doc[path] = value
+            for path, value in update.get("$push", {}).items():
+                if path == "sensors":
+                    doc["sensors"].append(value)
+                else:
+                    sensor["measurements"].extend(value["$each"])
+            for condition in update.get("$pull", {}).values():
+                pulled = {
+                    (c["date"], h) for c in condition["$or"] for h in c["hour"]["$in"]
+                }
+                sensor["measurements"] = [
+                    m
+                    for m in sensor["measurements"]
+                    if (m["date"], m["hour"]) not in pulled
+                ]
+
+
+def test_reloading_a_revised_hour_replaces_the_stored_reading():
+    def location(readings):
+        return {
+            "location_id": 1,
+            "location_name": "Station",
+            "sensors": [
+                {
+                    "sensor_id": 10,
+                    "parameter": "pm25",
+                    "units": "µg/m³",
+                    "measurements": [
+                        {"date": "2024-01-01", "hour": h, "value": v}
+                        for h, v in readings
+                    ],
+                }
+            ],
+        }
+
+    collection = FakeNestedCollection()
+    db = {nested_store.NESTED_COLLECTION: collection}
+    nested_store.load_structured_nested(db, [location([(0, 1.0), (1, 2.0)])])
+    nested_store.load_structured_nested(db, [location([(5, 9.0)])])  # Realtime
+    nested_store.load_structured_nested(db, [location([(1, 2.5)])])  # Revised
+
+    (doc,) = collection.docs
+    (sensor,) = doc["sensors"]
+    readings = sorted((m["hour"], m["value"]) for m in sensor["measurements"])
+    assert readings == [(0, 1.0), (1, 2.5), (5, 9.0)]
+
+
+def test_duplicate_locations_merge_with_later_copies_winning():
+    def stored(_id, name, units, measurements):
+        return {
+            "_id": _id,
+            "location_id": 1,
+            "location_name": name,
+            "sensors": [
+                {
+                    "sensor_id": 10,
+                    "parameter": "pm25",
+                    "units": units,
+                    "measurements": [
+                        {"date": "2024-01-01", "hour": h, "value": v}
+                        for h, v in measurements
+                    ],
+                }
+            ],
+        }
+
+    merged = nested_store.merge_location_documents(
+        [
+            stored(1, "Old", "ppm", [(0, 1.0), (1, 2.0)]),
+            stored(2, "New", "µg/m³", [(1, 20.0), (2, 3.0)]),
+        ]
+    )
+
+    assert "_id" not in merged
+    assert merged["location_name"] == "New"
+    (sensor,) = merged["sensors"]
+    assert sensor["units"] == "µg/m³"
+    assert [(m["hour"], m["value"]) for m in sensor["measurements"]] == [
+        (0, 1.0),
+        (1, 20.0),
+        (2, 3.0),
+    ]
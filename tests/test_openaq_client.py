@@ -0,0 +1,141 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from etl import openaq_client
+
+
+class FakeClock:
+    """Stands in for the `time` module so waits advance a virtual clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return 1_700_000_000.0 + self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def fake_response(status, headers=None):
+    return SimpleNamespace(status_code=status, headers=headers or {})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(openaq_client, "time", clock)
+    monkeypatch.setattr(openaq_client, "_buckets", {})
+    return clock
+
+
+def make_client(responses, max_retries=3):
+    client = openaq_client.OpenAQClient("test-key", max_retries=max_retries)
+    client.session.get = mock.Mock(side_effect=responses)
+    return client
+
+
+def test_retry_after_seconds_parses_delta_and_http_date(clock):
+    assert openaq_client.retry_after_seconds(fake_response(429, {"Retry-After": "7"})) == 7
+    assert openaq_client.retry_after_seconds(fake_response(429)) is None
+
+    # 30 seconds after the fake clock's wall time
+    http_date = "Tue, 14 Nov 2023 22:30:30 GMT"
+    assert openaq_client.retry_after_seconds(
+        fake_response(429, {"Retry-After": http_date})
+    ) == pytest.approx(30.0)
+
+
+def test_bucket_refills_at_configured_rate(clock):
+    bucket = openaq_client.TokenBucket(rate_per_minute=60, capacity=2)
+
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.slept == []
+
+    bucket.acquire()  # Burst spent: waits one token at 1 token/second
+    assert sum(clock.slept) == pytest.approx(1.0)
+
+    clock.now += 10  # Refill is capped at capacity
+    bucket.acquire()
+    bucket.acquire()
+    assert sum(clock.slept) == pytest.approx(1.0)
+
+
+def test_429_with_retry_after_pauses_shared_bucket(clock):
+    client = make_client(
+        [fake_response(429, {"Retry-After": "5"}), fake_response(200)]
+    )
+
+    response = client.get("/locations/1/latest")
+
+    assert response.status_code == 200
+    assert client.session.get.call_count == 2
+    assert sum(clock.slept) == pytest.approx(5.0)
+    # Every caller on the same key sees the pause
+    assert openaq_client.get_rate_limiter("test-key") is client.limiter
+
+
+def test_429_without_retry_after_backs_off_exponentially(clock):
+    client = make_client([fake_response(429), fake_response(429), fake_response(200)])
+
+    assert client.get("/sensors/1/measurements").status_code == 200
+    backoff = openaq_client.BACKOFF_SECONDS
+    assert sum(clock.slept) == pytest.approx(backoff + 2 * backoff)
+
+
+def test_gives_up_after_max_retries(clock):
+    client = make_client([fake_response(503)] * 3, max_retries=2)
+
+    assert client.get("/sensors/1/measurements").status_code == 503
+    assert client.session.get.call_count == 3
+
+
+def test_exhausted_ratelimit_headers_pause_until_reset(clock):
+    client = make_client(
+        [
+            fake_response(
+                200, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "12"}
+            ),
+            fake_response(200),
+        ]
+    )
+
+    client.get("/locations/1")
+    assert clock.slept == []
+    client.get("/locations/2")
+    assert sum(clock.slept) == pytest.approx(12.0)
+
+
+def test_ratelimit_headers_repace_bucket(clock):
+    bucket = openaq_client.TokenBucket(rate_per_minute=60, capacity=10)
+
+    bucket.update_from_headers(
+        {"X-RateLimit-Remaining": "30", "X-RateLimit-Reset": "60"}
+    )
+    assert bucket.rate == pytest.approx(0.5)
+
+    # An epoch reset is converted to seconds from now
+    bucket.update_from_headers(
+        {"X-RateLimit-Remaining": "20", "X-RateLimit-Reset": str(clock.time() + 10)}
+    )
+    assert bucket.rate == pytest.approx(2.0)
+
+
+def test_get_client_grows_pool_for_larger_callers(clock, monkeypatch):
+    monkeypatch.setattr(openaq_client, "_clients", {})
+
+    client = openaq_client.get_client("test-key", pool_size=4)
+    assert openaq_client.get_client("test-key", pool_size=2) is client
+    assert client.pool_size == 4
+
+    openaq_client.get_client("test-key", pool_size=12)
+    assert client.pool_size == 12
+    assert client.session.get_adapter("https://api.openaq.org")._pool_maxsize == 12
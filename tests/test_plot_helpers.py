@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from dashboard import plot_helpers as ph
+
+
+def series(n, spike_at=None):
+    x = np.arange(n, dtype="float64")
+    y = np.sin(x / 50.0)
+    if spike_at is not None:
+        y[spike_at] = 100.0
+    return x, y
+
+
+def test_lttb_keeps_threshold_points_including_the_ends():
+    x, y = series(10_000)
+    kept = ph.lttb_indices(x, y, 500)
+
+    assert len(kept) == 500
+    assert (kept[0], kept[-1]) == (0, 9_999)
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_keeps_an_isolated_spike():
+    x, y = series(10_000, spike_at=4_321)
+
+    assert 4_321 in ph.lttb_indices(x, y, 100)
+
+
+def test_lttb_returns_short_inputs_unchanged():
+    x, y = series(500)
+
+    assert ph.lttb_indices(x, y, 500).tolist() == list(range(500))
+    assert ph.lttb_indices(x, y, 1_000).tolist() == list(range(500))
+
+
+def hourly_frame(n):
+    index = pd.date_range("2024-01-01", periods=n, freq="h", name="datetime")
+    return pd.DataFrame({"value": np.arange(n, dtype="float64")}, index=index)
+
+
+def test_line_plot_data_downsamples_long_series_for_webgl():
+    data = ph.line_plot_data(hourly_frame(5_000), "H")
+
+    assert len(data["t"]) == len(data["v"]) == ph.MAX_POINTS_PER_TRACE
+    assert data["t"][0] == pd.Timestamp("2024-01-01").value // 1_000_000
+    assert data["v"][-1] == 4_999.0
+    assert data["webgl"]
+
+
+def test_line_plot_data_keeps_short_series_whole():
+    data = ph.line_plot_data(hourly_frame(48), "D")
+
+    assert data["t"] == [
+        pd.Timestamp("2024-01-01").value // 1_000_000,
+        pd.Timestamp("2024-01-02").value // 1_000_000,
+    ]
+    assert data["v"] == [11.5, 35.5]
+    assert not data["webgl"]
@@ -0,0 +1,26 @@
+import os
+
+from etl import raw_store
+
+
+def entries(hours):
+    return [
+        {"datetime": f"2024-01-01T{h:02d}:00:00Z", "parameter": "pm25", "value": h}
+        for h in hours
+    ]
+
+
+def test_compaction_merges_parts_in_time_order(monkeypatch, tmp_path):
+    monkeypatch.setattr(raw_store, "PARQUET_DIR", str(tmp_path))
+    # Window mode fetches newest chunks first
+    for hours in ([4, 5], [2, 3], [0, 1]):
+        raw_store.write_sensor_batch(7, entries(hours), fmt="parquet")
+    raw_store.write_sensor_batch(8, entries([0]), fmt="parquet")
+
+    assert raw_store.compact_parquet() == 2
+
+    assert len(os.listdir(tmp_path / "sensor_id=7")) == 1
+    assert len(os.listdir(tmp_path / "sensor_id=8")) == 1
+    df = raw_store.read_sensor_frame([7, 8], fmt="parquet")
+    assert df[df["sensor_id"] == 7]["value"].tolist() == [0, 1, 2, 3, 4, 5]
+    assert raw_store.compact_parquet() == 0
@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from etl import realtime_extract as rx
+
+
+def test_probe_errors_fall_back_to_known_sensors(monkeypatch):
+    recent = (datetime.now(timezone.utc) - timedelta(minutes=5)).isoformat()
+
+    def fetch_latest(location_id):
+        if location_id == 1:
+            raise requests.exceptions.ConnectionError("reset")
+        return {20: recent}
+
+    monkeypatch.setattr(rx, "fetch_latest_by_sensor", fetch_latest)
+    locations = [
+        {"id": 1, "active_sensor_ids": [10, 11]},
+        {"id": 2, "active_sensor_ids": [20]},
+    ]
+
+    due = rx.refresh_active_sensors(locations, watermarks={})
+
+    assert due == {1: [10, 11], 2: [20]}
@@ -0,0 +1,61 @@
+import gzip
+import json
+
+import pytest
+
+from etl import realtime_transform as rt
+
+
+@pytest.fixture
+def files(monkeypatch, tmp_path):
+    paths = {
+        "SENSOR_FILE": tmp_path / "active.jsonl",
+        "SENSOR_UNITS_FILE": tmp_path / "units.jsonl",
+        "EXTRACTED_FILE": tmp_path / "raw.jsonl.gz",
+        "TRANSFORMED_FILE": tmp_path / "transformed.json",
+        "SENSOR_TABLE_CACHE": tmp_path / "table.pkl",
+    }
+    for name, path in paths.items():
+        monkeypatch.setattr(rt, name, str(path))
+    monkeypatch.setattr(rt, "READ_CHUNK_ROWS", 2)
+
+    locations = [
+        {"id": 1, "name": "A", "country": "US", "active_sensor_ids": [10]},
+        {"id": 2, "name": "B", "country": "US", "active_sensor_ids": [20]},
+        {"id": 3, "name": "C", "country": "US", "active_sensor_ids": [30]},
+    ]
+    paths["SENSOR_FILE"].write_text("".join(json.dumps(l) + "\n" for l in locations))
+    units = [{"sensor_id": 10, "parameter": "pm25", "units": "µg/m³"}]
+    paths["SENSOR_UNITS_FILE"].write_text("".join(json.dumps(u) + "\n" for u in units))
+
+    records = [
+        {"sensor_id": 10, "datetime": f"2024-01-01T0{h}:00:00Z", "parameter": "pm25", "value": h}
+        for h in range(3)
+    ] + [{"sensor_id": 20, "datetime": "2024-01-01T05:00:00Z", "parameter": "o3", "value": 0.1}]
+    with gzip.open(paths["EXTRACTED_FILE"], "wt") as f:
+        f.writelines(json.dumps(r) + "\n" for r in records)
+    return paths
+
+
+def test_buffer_is_read_in_bounded_chunks(files):
+    assert [len(chunk) for chunk in rt.iter_extracted()] == [2, 2]
+
+
+def test_chunks_are_written_as_mergeable_location_documents(files):
+    rt.transform_realtime_data()
+
+    documents = json.loads(files["TRANSFORMED_FILE"].read_text())
+    measurements = {}
+    for doc in documents:
+        for sensor in doc["sensors"]:
+            key = (doc["location_id"], sensor["sensor_id"], sensor["units"])
+            measurements.setdefault(key, []).extend(sensor["measurements"])
+
+    assert measurements == {
+        (1, 10, "µg/m³"): [
+            {"date": "2024-01-01", "hour": h, "value": h} for h in range(3)
+        ],
+        (2, 20, "unknown"): [{"date": "2024-01-01", "hour": 5, "value": 0.1}],
+    }
+    # Locations without new records are still emitted, with no sensors
+    assert [d["sensors"] for d in documents if d["location_id"] == 3] == [[]]
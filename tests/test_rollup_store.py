@@ -0,0 +1,346 @@
+import calendar
+import copy
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from dashboard import db_helpers
+from dashboard.plot_helpers import RESAMPLE_RULES
+from etl import rollup_store
+
+# A small in-memory evaluator for the update and aggregation shapes the rollup
+# code sends, so the pipelines run end to end without a MongoDB server
+
+
+def get_path(doc, path):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, list):
+            value = [item.get(part) for item in value]
+        elif isinstance(value, dict):
+            value = value.get(part)
+        else:
+            return None
+    return value
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    last_day = calendar.monthrange(year, month)[1]
+    return day.replace(year=year, month=month, day=min(day.day, last_day))
+
+
+def _aggregate(values, op):
+    values = [v for v in values if v is not None]
+    if op == "$sum":
+        return sum(values)
+    if not values:
+        return None
+    return {"$min": min, "$max": max, "$avg": lambda v: sum(v) / len(v)}[op](values)
+
+
+def evaluate(expr, doc, this=None):
+    if isinstance(expr, str) and expr == "$$this.v":
+        return this["v"]
+    if isinstance(expr, str) and expr.startswith("$"):
+        return get_path(doc, expr[1:])
+    if isinstance(expr, list):
+        return [evaluate(e, doc, this) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) != 1 or not next(iter(expr)).startswith("$"):
+        return {k: evaluate(v, doc, this) for k, v in expr.items()}
+
+    (op, arg), = expr.items()
+    if op in ("$sum", "$min", "$max", "$avg"):
+        value = evaluate(arg, doc, this)
+        return _aggregate(value if isinstance(value, list) else [value], op)
+    if op == "$size":
+        return len(evaluate(arg, doc, this))
+    if op == "$map":
+        return [evaluate(arg["in"], doc, item) for item in evaluate(arg["input"], doc)]
+    if op == "$objectToArray":
+        return [{"k": k, "v": v} for k, v in evaluate(arg, doc).items()]
+    if op == "$dateFromString":
+        return datetime.fromisoformat(evaluate(arg["dateString"], doc))
+    if op == "$dateTrunc":
+        day = evaluate(arg["date"], doc)
+        if arg["unit"] == "month":
+            return day.replace(day=1)
+        assert arg["startOfWeek"] == "monday"
+        return day - timedelta(days=day.weekday())
+    if op == "$dateAdd":
+        start, amount = evaluate(arg["startDate"], doc), arg["amount"]
+        if arg["unit"] == "month":
+            return add_months(start, amount)
+        return start + timedelta(days=amount)
+    if op == "$dateToString":
+        return evaluate(arg["date"], doc).strftime(arg["format"])
+    if op == "$isoDayOfWeek":
+        return evaluate(arg, doc).isoweekday()
+    if op == "$substrBytes":
+        value, start, length = evaluate(arg, doc)
+        return value[start : start + length]
+    if op == "$toInt":
+        return int(evaluate(arg, doc))
+    if op == "$divide":
+        a, b = evaluate(arg, doc)
+        return a / b
+    raise NotImplementedError(op)
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        value = get_path(doc, field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, operand in condition.items():
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$gte" and not value >= operand:
+                return False
+            if op == "$lte" and not value <= operand:
+                return False
+    return True
+
+
+def set_path(doc, path, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def apply_stages(docs, stages, db):
+    for stage in stages:
+        (name, spec), = stage.items()
+        if name == "$match":
+            docs = [d for d in docs if matches(d, spec)]
+        elif name == "$set":
+            for d in docs:
+                d.update({k: evaluate(v, d) for k, v in spec.items()})
+        elif name == "$unset":
+            for d in docs:
+                d.pop(spec, None)
+        elif name == "$unwind":
+            field = spec[1:]
+            docs = [{**d, field: item} for d in docs for item in d[field]]
+        elif name == "$group":
+            groups = defaultdict(list)
+            keys = {}
+            for d in docs:
+                key = evaluate(spec["_id"], d)
+                frozen = repr(sorted(key.items()))
+                keys[frozen] = key
+                groups[frozen].append(d)
+            docs = []
+            for frozen, members in groups.items():
+                out = {"_id": keys[frozen]}
+                for field, acc in spec.items():
+                    if field == "_id":
+                        continue
+                    (op, arg), = acc.items()
+                    values = [evaluate(arg, d) for d in members]
+                    if op == "$first":
+                        out[field] = values[0]
+                    elif op == "$push":
+                        out[field] = values
+                    else:
+                        out[field] = _aggregate(values, op)
+                docs.append(out)
+        elif name == "$project":
+            projected = []
+            for d in docs:
+                out = {}
+                for field, value in spec.items():
+                    if value == 0:
+                        continue
+                    out[field] = d.get(field) if value == 1 else evaluate(value, d)
+                projected.append(out)
+            docs = projected
+        elif name == "$merge":
+            target = db[spec["into"]]
+            for d in docs:
+                key = {field: d[field] for field in spec["on"]}
+                target.docs = [t for t in target.docs if not matches(t, key)]
+                target.docs.append(d)
+            docs = []
+        else:
+            raise NotImplementedError(name)
+    return docs
+
+
+class FakeCollection:
+    def __init__(self, db):
+        self.db = db
+        self.docs = []
+
+    def bulk_write(self, operations, ordered=True):
+        for op in operations:
+            targets = [d for d in self.docs if matches(d, op._filter)]
+            if isinstance(op._doc, list):  # Update pipeline
+                apply_stages(targets, op._doc, self.db)
+                continue
+            if not targets and op._upsert:
+                targets = [copy.deepcopy(op._filter)]
+                self.docs.append(targets[0])
+            for d in targets[:1]:
+                for path, value in op._doc["$set"].items():
+                    set_path(d, path, value)
+
+    def aggregate(self, pipeline):
+        return apply_stages(copy.deepcopy(self.docs), pipeline, self.db)
+
+    def find(self, query, projection):
+        return [
+            {k: v for k, v in d.items() if projection.get(k)}
+            for d in self.docs
+            if matches(d, query)
+        ]
+
+
+class FakeDB(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection(self)
+        return self[name]
+
+
+# -----------------------------
+# Tests
+# -----------------------------
+
+# Across a week and a month boundary: Sat 6 and Sun 7 Jan close one week, Mon
+# 8 Jan starts the next, and Wed 31 Jan / Thu 1 Feb share a week but not a month
+READINGS = {
+    ("2024-01-06", 0): 1.0,
+    ("2024-01-06", 1): 3.0,
+    ("2024-01-07", 0): 5.0,
+    ("2024-01-08", 0): 7.0,
+    ("2024-01-31", 12): 2.0,
+    ("2024-02-01", 12): 4.0,
+}
+
+
+def location(readings, location_id=1, sensor_id=10):
+    return {
+        "location_id": location_id,
+        "location_name": f"Station {location_id}",
+        "sensors": [
+            {
+                "sensor_id": sensor_id,
+                "parameter": "pm25",
+                "units": "µg/m³",
+                "measurements": [
+                    {"date": day, "hour": hour, "value": value}
+                    for (day, hour), value in readings.items()
+                ],
+            }
+        ],
+    }
+
+
+def pandas_means(readings, agg_level):
+    # What the dashboard would get by resampling the raw hourly series
+    index = pd.to_datetime(
+        [f"{day} {hour:02d}:00" for day, hour in readings], format="%Y-%m-%d %H:%M"
+    )
+    series = pd.Series(list(readings.values()), index=index)
+    return series.resample(RESAMPLE_RULES[agg_level]).mean().dropna()
+
+
+@pytest.fixture
+def rollups(monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(db_helpers, "daily_rollups", db[rollup_store.DAILY_COLLECTION])
+    monkeypatch.setattr(db_helpers, "period_rollups", db[rollup_store.PERIOD_COLLECTION])
+    monkeypatch.setattr(
+        db_helpers, "profile_rollups", db[rollup_store.PROFILE_COLLECTION]
+    )
+    monkeypatch.setattr(db_helpers, "_location_id", lambda name: 1)
+    return db
+
+
+def rollup_records(agg_level):
+    # Unwrapped, so no query cache (and no MongoDB version check) is involved
+    df = db_helpers.get_rollup_records.__wrapped__("Station 1", "pm25", agg_level)
+    return pd.Series(df["value"].to_numpy(), index=pd.DatetimeIndex(df["datetime"]))
+
+
+@pytest.mark.parametrize("agg_level", ["D", "W", "M"])
+def test_rollups_match_pandas_resample_labels_and_means(rollups, agg_level):
+    rollup_store.update_rollups(rollups, [location(READINGS)])
+
+    expected = pandas_means(READINGS, agg_level)
+    actual = rollup_records(agg_level)
+    assert list(actual.index) == list(expected.index)
+    assert actual.to_numpy() == pytest.approx(expected.to_numpy())
+
+
+def test_period_documents_are_keyed_by_their_closing_day(rollups):
+    rollup_store.update_rollups(rollups, [location(READINGS)])
+
+    periods = {
+        (d["period"], d["date"]): d["count"]
+        for d in rollups[rollup_store.PERIOD_COLLECTION].docs
+    }
+    assert periods == {
+        ("W", "2024-01-07"): 3,
+        ("W", "2024-01-14"): 1,
+        ("W", "2024-02-04"): 2,
+        ("M", "2024-01-31"): 5,
+        ("M", "2024-02-29"): 1,
+    }
+
+
+def test_hour_of_week_cells_by_month(rollups):
+    rollup_store.update_rollups(rollups, [location(READINGS)])
+
+    january = next(
+        d
+        for d in rollups[rollup_store.PROFILE_COLLECTION].docs
+        if d["month"] == "2024-01"
+    )
+    cells = {(c["dow"], c["hour"]): (c["sum"], c["count"]) for c in january["cells"]}
+    assert cells == {
+        (6, 0): (1.0, 1),  # Saturday
+        (6, 1): (3.0, 1),
+        (7, 0): (5.0, 1),  # Sunday
+        (1, 0): (7.0, 1),  # Monday
+        (3, 12): (2.0, 1),  # Wednesday
+    }
+
+    df = db_helpers.get_hour_of_week_cells.__wrapped__("Station 1", "pm25")
+    saturday = df[(df["dayofweek"] == "Saturday") & (df["hour"] == 0)]
+    assert saturday[["year", "sum", "count"]].values.tolist() == [[2024, 1.0, 1]]
+
+
+def test_incremental_update_regroups_only_touched_sensors(rollups):
+    other = location({("2024-01-06", 0): 50.0}, location_id=2, sensor_id=20)
+    rollup_store.update_rollups(rollups, [location(READINGS), other])
+
+    revised = {("2024-02-01", 12): 10.0, ("2024-02-01", 13): 6.0}
+    _, _, touched = rollup_store.build_daily_operations([location(revised)])
+    assert rollup_store.period_pipeline(touched, "W")[0]["$match"] == {
+        "sensor_id": {"$in": [10]},
+        "parameter": {"$in": ["pm25"]},
+        "date": {"$gte": "2024-01-29", "$lte": "2024-02-04"},
+    }
+
+    rollup_store.update_rollups(rollups, [location(revised)])
+
+    periods = {
+        (d["sensor_id"], d["period"], d["date"]): d
+        for d in rollups[rollup_store.PERIOD_COLLECTION].docs
+    }
+    # The revised hour replaces the stored one instead of adding to it
+    assert periods[(10, "M", "2024-02-29")]["count"] == 2
+    assert periods[(10, "M", "2024-02-29")]["mean"] == pytest.approx(8.0)
+    # Days of the week before the new month are regrouped with it
+    assert periods[(10, "W", "2024-02-04")]["count"] == 3
+    assert periods[(10, "M", "2024-01-31")]["count"] == 5
+    assert periods[(20, "W", "2024-01-07")]["mean"] == 50.0
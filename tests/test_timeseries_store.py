@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+from unittest import mock
+
+from etl import timeseries_store as ts
+
+
+def test_load_deletes_only_the_exact_keys_it_inserts():
+    db = mock.MagicMock()
+    db.list_collections.return_value = [
+        {"name": ts.TIMESERIES_COLLECTION, "type": "timeseries"}
+    ]
+    location = {
+        "location_id": 1,
+        "location_name": "A",
+        "country": "US",
+        "sensors": [
+            {
+                "sensor_id": 10,
+                "parameter": "pm25",
+                "units": "µg/m³",
+                "measurements": [
+                    {"date": "2024-01-01", "hour": 0, "value": 1.0},
+                    {"date": "2024-01-03", "hour": 6, "value": 2.0},
+                ],
+            }
+        ],
+    }
+
+    ts.load_structured_timeseries(db, [location])
+
+    measurements = db[ts.TIMESERIES_COLLECTION]
+    (deletes,), _ = measurements.bulk_write.call_args
+    assert [d._filter for d in deletes] == [
+        {
+            "meta.sensor_id": 10,
+            "meta.parameter": "pm25",
+            "datetime": {
+                "$in": [
+                    datetime(2024, 1, 1, 0, tzinfo=timezone.utc),
+                    datetime(2024, 1, 3, 6, tzinfo=timezone.utc),
+                ]
+            },
+        }
+    ]
+    (docs,), _ = measurements.insert_many.call_args
+    assert [d["value"] for d in docs] == [1.0, 2.0]